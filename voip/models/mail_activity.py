@@ -10,6 +10,7 @@ class MailActivity(models.Model):
     _inherit = ["mail.activity", "voip.country.code.mixin"]
 
     phone = fields.Char("Phone", compute="_compute_phone", readonly=False, store=True)
+    country_code_from_phone = fields.Char(store=True, index="btree_not_null")
 
     @api.depends("res_model", "res_id", "activity_type_id")
     def _compute_phone(self):
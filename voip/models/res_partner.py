@@ -1,10 +1,15 @@
+import logging
 import unicodedata
+from functools import lru_cache
 
 from odoo import api, fields, models
 from odoo.fields import Domain
+from odoo.tools.sql import column_exists, create_column, create_index
 
 from odoo.addons.mail.tools.discuss import Store
 
+_logger = logging.getLogger(__name__)
+
 """
     █
     █
@@ -61,12 +66,48 @@ def expand_ligatures(text):
     return text
 
 
+# Columns searched with leading wildcards by `get_contacts`, on every softphone keystroke
+CONTACT_SEARCH_COLUMNS = ["complete_name", "email", "phone", "t9_name"]
+
+
 def unaccent(text):
     return "".join(
         c for c in unicodedata.normalize("NFKD", text) if unicodedata.category(c) != "Mn"
     )
 
 
+class T9Table(dict):
+    """`str.translate` table of the T9 encoding, filled on first use of each character.
+
+    A character is unaccented, its ligatures expanded and casefolded, then
+    letters become their digit, digits and spaces are kept and anything else
+    becomes an 'x'. Names are then encoded with a single `translate` call.
+    """
+
+    def __missing__(self, codepoint):
+        text = expand_ligatures(unaccent(chr(codepoint))).casefold()
+        encoded = "".join(T9_MAPPING.get(char) or (char if char in "0123456789 " else "x") for char in text)
+        self[codepoint] = encoded
+        return encoded
+
+
+T9_TABLE = T9Table()
+
+# Encoded names kept per worker
+T9_CACHE_SIZE = 65536
+# Partners per UPDATE when t9_name is filled on install
+T9_BACKFILL_BATCH_SIZE = 10000
+
+
+@lru_cache(maxsize=T9_CACHE_SIZE)
+def t9_encode(name):
+    """Encode a name in T9, with a leading space so that a pattern like
+    '% 234%' matches at the beginning of each word. Returns False for empty names."""
+    if not name:
+        return False
+    return " " + name.translate(T9_TABLE)
+
+
 class ResPartner(models.Model):
     _name = "res.partner"
     _inherit = ["res.partner", "voip.country.code.mixin", "voip.queue.mixin"]
@@ -82,25 +123,67 @@ class ResPartner(models.Model):
         ),
         store=True,
     )
+    country_code_from_phone = fields.Char(store=True, index="btree_not_null")
+
+    def init(self):
+        super().init()
+        # Trigram indexes let `like '%...%'` use an index instead of scanning
+        # all partners. They are named after this module: the columns of
+        # `base` may already carry a btree index under the default name.
+        if not self.env.registry.has_trigram:
+            return
+        for column in CONTACT_SEARCH_COLUMNS:
+            create_index(
+                self.env.cr,
+                f"res_partner_voip_{column}_trgm_idx",
+                self._table,
+                [f"{column} gin_trgm_ops"],
+                method="gin",
+            )
+
+    def _auto_init(self):
+        # On install, t9_name is filled in batches here rather than computed
+        # by the ORM for all partners at once. Upgrades find the column and
+        # skip the backfill.
+        if not column_exists(self.env.cr, self._table, "t9_name"):
+            create_column(self.env.cr, self._table, "t9_name", "varchar")
+            self._voip_fill_t9_names()
+        return super()._auto_init()
+
+    def _voip_fill_t9_names(self, batch_size=T9_BACKFILL_BATCH_SIZE):
+        """Compute the missing T9 names in SQL batches, logging the progress."""
+        cr = self.env.cr
+        cr.execute("SELECT COUNT(*) FROM res_partner WHERE t9_name IS NULL AND name IS NOT NULL")
+        total = cr.fetchone()[0]
+        if not total:
+            return
+        _logger.info("Computing the T9 name of %d partners", total)
+        done = last_id = 0
+        while True:
+            cr.execute("""
+                SELECT id, name
+                  FROM res_partner
+                 WHERE t9_name IS NULL AND name IS NOT NULL AND id > %s
+              ORDER BY id
+                 LIMIT %s
+            """, [last_id, batch_size])
+            rows = cr.fetchall()
+            if not rows:
+                break
+            cr.execute("""
+                UPDATE res_partner
+                   SET t9_name = batch.t9_name
+                  FROM unnest(%s::int[], %s::varchar[]) AS batch(id, t9_name)
+                 WHERE res_partner.id = batch.id
+            """, [[row[0] for row in rows], [t9_encode(row[1]) or None for row in rows]])
+            done += len(rows)
+            last_id = rows[-1][0]
+            _logger.info("T9 names: %d/%d partners", done, total)
 
     @api.depends("name")
     def _compute_t9_name(self):
-        def encode(letter):
-            if letter in T9_MAPPING:
-                return T9_MAPPING[letter]
-            if letter in "0123456789 ":
-                return letter
-            return "x"
-
         for partner in self:
-            if not partner.name:
-                partner.t9_name = False
-                continue
-            normalized_name = expand_ligatures(unaccent(partner.name)).casefold()
-            partner.t9_name = "".join(encode(letter) for letter in normalized_name)
-            # Add a space at the beginning so you can search for matches at the
-            # beginning of each word using a pattern like '% 234%'.
-            partner.t9_name = " " + partner.t9_name
+            partner.t9_name = t9_encode(partner.name)
 
     @api.model
     def get_contacts(self, offset, limit, search_terms, t9_search=False):
@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 try:
     import phonenumbers
@@ -18,39 +19,61 @@ INTERNATIONAL_PHONE_NUMBER_RE = re.compile(
 )
 
 
+# Numbers seen by a worker, call lists and the softphone keep asking for the same ones
+EXTRACT_CACHE_SIZE = 65536
+
+
+def _build_prefix_table():
+    """Map the dialing prefixes that identify a single region to its (iso, itu) codes.
+
+    e.g. accept 351->['PT'] for Portugal, reject 1->['US','CA',...] for North America.
+    """
+    if not phonenumbers:
+        return {}
+    table = {}
+    for country_code, region_codes in COUNTRY_CODE_TO_REGION_CODE.items():
+        if len(region_codes) != 1:
+            continue
+        region_code = phonenumbers.region_code_for_country_code(country_code)
+        if region_code != "ZZ":
+            table[str(country_code)] = (region_code.lower(), str(country_code))
+    return table
+
+
+PREFIX_TABLE = _build_prefix_table()
+# Country codes are at most 3 digits long
+PREFIX_MAX_LENGTH = max(map(len, PREFIX_TABLE), default=0)
+
+
 def extract_country_code(phone_number):
+    """Return the ISO and ITU country codes of a phone number, as a new dict
+    the caller is free to modify."""
+    iso, itu = _extract_country_code(phone_number)
+    return {"iso": iso, "itu": itu}
+
+
+@lru_cache(maxsize=EXTRACT_CACHE_SIZE)
+def _extract_country_code(phone_number):
     if not phonenumbers:
-        return {"iso": "", "itu": ""}
+        return "", ""
 
     def extract_country_code_from_partial_number(phone_number):
         match = INTERNATIONAL_PHONE_NUMBER_RE.match(phone_number)
         if not match:
-            return {"iso": "", "itu": ""}
+            return "", ""
         sanitized_number = match.group("phone_number")  # the phone number without the + or 00
-        for length in range(min(4, len(sanitized_number) + 1), 0, -1):  # 3 is the max length of a country code
-            country_code = int(sanitized_number[:length])
-            if (
-                country_code in COUNTRY_CODE_TO_REGION_CODE
-                # Only accept country codes that map to exactly one region
-                # (e.g., accept 44->['GB'] for UK, reject 1->['US','CA',...] for North America)
-                and len(COUNTRY_CODE_TO_REGION_CODE[country_code]) == 1
-            ):
-                region_code = phonenumbers.region_code_for_country_code(country_code)
-                return {
-                    "iso": region_code.lower() if region_code != "ZZ" else "",
-                    "itu": str(country_code) if region_code != "ZZ" else "",
-                }
-        return {"iso": "", "itu": ""}
+        for length in range(min(PREFIX_MAX_LENGTH, len(sanitized_number)), 0, -1):
+            codes = PREFIX_TABLE.get(sanitized_number[:length])
+            if codes:
+                return codes
+        return "", ""
 
     if len(phone_number) >= 6 and phonenumbers:
         try:
             parsed_number = phonenumbers.parse(phone_number, None)
             country_code = phonenumbers.region_code_for_number(parsed_number)
             if country_code:
-                return {
-                    "iso": country_code.lower(),
-                    "itu": str(parsed_number.country_code),
-                }
+                return country_code.lower(), str(parsed_number.country_code)
         except phonenumbers.NumberParseException:
             pass
     return extract_country_code_from_partial_number(phone_number)
@@ -1,7 +1,27 @@
+import logging
+
 from odoo import api, fields, models
+from odoo.tools import SQL
+from odoo.tools.sql import column_exists, create_column
 
 from odoo.addons.voip.models.utils import extract_country_code
 
+_logger = logging.getLogger(__name__)
+
+# Records per UPDATE when a stored country code column is filled on install
+COUNTRY_CODE_BACKFILL_BATCH_SIZE = 10000
+
+
+def country_code_of(phone_numbers):
+    """Return the ISO country code of the first of `phone_numbers` that has one, or ''."""
+    for phone_number in phone_numbers:
+        if not phone_number:
+            continue
+        iso_code = extract_country_code(phone_number)["iso"]
+        if iso_code:
+            return iso_code
+    return ""
+
 
 class VoipCountryCode(models.AbstractModel):
     """Mixin to compute the ISO country code from a phone number.
@@ -13,6 +33,11 @@ class VoipCountryCode(models.AbstractModel):
 
     Models inheriting this mixin should have a phone number field. If the field
     is not named 'phone', they should override `_voip_get_phone_field()`.
+
+    Models whose records are listed in bulk can store the code by redefining
+    the field with `store=True`: it is then only recomputed when a phone
+    number changes, and can be filtered and grouped on. On install, the new
+    column is filled in batches rather than record by record.
     """
 
     _name = "voip.country.code.mixin"
@@ -27,20 +52,72 @@ class VoipCountryCode(models.AbstractModel):
         ),
     )
 
-    @api.depends(lambda self: self._phone_get_number_fields())
-    def _compute_country_code_from_phone(self) -> None:
+    def _voip_get_country_code_fields(self):
+        """Fields the country code is read from, by order of preference: the
+        sanitized numbers first, then the numbers as entered."""
         fields = self._phone_get_number_fields()
         sanitized_fields = [f"{field}_sanitized" for field in fields if "sanitized" not in field]
         sanitized_fields = [field for field in sanitized_fields if field in self]
+        return [*sanitized_fields, *fields]
+
+    @api.depends(lambda self: self._voip_get_country_code_fields())
+    def _compute_country_code_from_phone(self) -> None:
+        fields = self._voip_get_country_code_fields()
         for record in self:
-            for field in [*sanitized_fields, *fields]:
-                phone_number = record[field]
-                if not phone_number:
-                    continue
-                iso_code = extract_country_code(phone_number)["iso"]
-                if not iso_code:
-                    continue
-                record.country_code_from_phone = iso_code
+            record.country_code_from_phone = country_code_of(record[field] for field in fields)
+
+    def _auto_init(self):
+        field = self._fields["country_code_from_phone"]
+        if self._auto and field.store and not column_exists(self.env.cr, self._table, field.name):
+            columns = self._voip_get_country_code_fields()
+            # Numbers that are themselves new columns will be computed by the
+            # ORM, and the country code along with them
+            if all(self._fields[fname].store and column_exists(self.env.cr, self._table, fname) for fname in columns):
+                create_column(self.env.cr, self._table, field.name, "varchar")
+                self._voip_fill_country_codes(columns)
+        return super()._auto_init()
+
+    def _voip_fill_country_codes(self, columns, batch_size=COUNTRY_CODE_BACKFILL_BATCH_SIZE):
+        """Compute the stored country codes from the `columns` holding phone numbers, in SQL batches.
+
+        Records without any number get '', as the compute would give them.
+        """
+        cr = self.env.cr
+        has_number = SQL(" OR ").join(SQL("%s IS NOT NULL", SQL.identifier(column)) for column in columns)
+        cr.execute(SQL(
+            "UPDATE %s SET country_code_from_phone = '' WHERE NOT (%s)",
+            SQL.identifier(self._table),
+            has_number,
+        ))
+        cr.execute(SQL("SELECT COUNT(*) FROM %s WHERE %s", SQL.identifier(self._table), has_number))
+        total = cr.fetchone()[0]
+        if not total:
+            return
+        _logger.info("Computing the country code of %d %s records", total, self._name)
+        done = last_id = 0
+        while True:
+            cr.execute(SQL(
+                "SELECT id, %s FROM %s WHERE (%s) AND id > %s ORDER BY id LIMIT %s",
+                SQL(", ").join(map(SQL.identifier, columns)),
+                SQL.identifier(self._table),
+                has_number,
+                last_id,
+                batch_size,
+            ))
+            rows = cr.fetchall()
+            if not rows:
                 break
-            else:
-                record.country_code_from_phone = ""
+            cr.execute(SQL(
+                """
+                UPDATE %(table)s
+                   SET country_code_from_phone = batch.code
+                  FROM unnest(%(ids)s::int[], %(codes)s::varchar[]) AS batch(id, code)
+                 WHERE %(table)s.id = batch.id
+                """,
+                table=SQL.identifier(self._table),
+                ids=[row[0] for row in rows],
+                codes=[country_code_of(row[1:]) for row in rows],
+            ))
+            done += len(rows)
+            last_id = rows[-1][0]
+            _logger.info("Country codes of %s: %d/%d records", self._name, done, total)
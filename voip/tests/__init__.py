@@ -5,3 +5,5 @@ from . import test_voip_t9
 from . import test_voip_user_config
 from . import test_voip_call
 from . import test_voip_controller
+from . import test_voip_country_code
+from . import test_voip_benchmark
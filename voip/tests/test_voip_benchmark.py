@@ -0,0 +1,145 @@
+import logging
+import random
+import time
+
+from odoo.tests import common, tagged
+from odoo.tools import SQL
+
+from odoo.addons.voip.models.res_partner import (
+    CONTACT_SEARCH_COLUMNS, T9_MAPPING, expand_ligatures, t9_encode, unaccent,
+)
+from odoo.addons.voip.models.utils import _extract_country_code, extract_country_code
+
+_logger = logging.getLogger(__name__)
+
+# The self-join formerly used by `VoipCall._compute_call_count`, for comparison
+LEGACY_CALL_COUNT_QUERY = """
+    SELECT call_1.id, COUNT(DISTINCT call_2.id) AS count
+      FROM voip_call AS call_1
+      JOIN voip_call AS call_2 ON (
+               call_1.phone_number = call_2.phone_number
+            OR call_1.partner_id = call_2.partner_id
+           )
+     WHERE call_1.id IN %(ids)s
+  GROUP BY call_1.id
+"""
+
+
+def legacy_t9_encode(name):
+    """The per-letter encoding formerly done by `ResPartner._compute_t9_name`, for comparison."""
+    def encode(letter):
+        if letter in T9_MAPPING:
+            return T9_MAPPING[letter]
+        if letter in "0123456789 ":
+            return letter
+        return "x"
+
+    return " " + "".join(encode(letter) for letter in expand_ligatures(unaccent(name)).casefold())
+
+
+@tagged("voip_benchmark", "post_install", "-at_install", "-standard")
+class TestVoipBenchmark(common.TransactionCase):
+    """Timings on synthetic data, run with --test-tags voip_benchmark."""
+
+    def _time(self, func, rounds=5):
+        start = time.perf_counter()
+        for _i in range(rounds):
+            func()
+        return (time.perf_counter() - start) / rounds
+
+    def test_call_count_on_large_call_log(self):
+        partner_ids = self.env["res.partner"].create([{"name": f"Caller {i}"} for i in range(1000)]).ids
+        # 1M calls over 50k numbers, a few of them very frequent, half linked to a partner
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO voip_call (phone_number, partner_id, direction, state, create_date)
+                 SELECT '+3247' || LPAD((CASE WHEN i %% 10 = 0 THEN i %% 5 ELSE i %% 50000 END)::text, 6, '0'),
+                        CASE WHEN i %% 2 = 0 THEN (%(partner_ids)s)[1 + i %% 1000] END,
+                        'outgoing', 'terminated', NOW() AT TIME ZONE 'UTC'
+                   FROM generate_series(1, 1000000) AS i
+            """,
+            partner_ids=partner_ids,
+        ))
+        self.env.cr.execute("ANALYZE voip_call")
+        calls = self.env["voip.call"].search([], limit=80, order="id DESC")
+
+        def compute():
+            calls.invalidate_recordset(["call_count"])
+            calls.mapped("call_count")
+
+        def legacy():
+            self.env.cr.execute(SQL(LEGACY_CALL_COUNT_QUERY, ids=tuple(calls.ids)))
+            self.env.cr.fetchall()
+
+        self.env.cr.execute(SQL(LEGACY_CALL_COUNT_QUERY, ids=tuple(calls.ids)))
+        self.assertEqual(dict(self.env.cr.fetchall()), {call.id: call.call_count for call in calls})
+        _logger.info(
+            "call_count of 80 calls over 1M rows: self-join %.1f ms, grouped counts %.1f ms",
+            self._time(legacy, rounds=1) * 1000, self._time(compute) * 1000,
+        )
+
+    def test_get_contacts_on_large_partner_base(self):
+        # 500k contacts with distinct names, emails and numbers
+        self.env.cr.execute("""
+            INSERT INTO res_partner (name, complete_name, email, phone, t9_name, active, type)
+                 SELECT 'Contact ' || md5(i::text),
+                        'Contact ' || md5(i::text),
+                        'contact' || i || '@example.com',
+                        '+3247' || LPAD(i::text, 7, '0'),
+                        ' 2668228 ' || TRANSLATE(md5(i::text), 'abcdef', '222333'),
+                        TRUE, 'contact'
+                   FROM generate_series(1, 500000) AS i
+        """)
+        self.env.cr.execute("ANALYZE res_partner")
+        Partner = self.env["res.partner"]
+        searches = [("a1b2c", False), ("contact4242", False), ("+324700123", False), ("2668228 312", True)]
+
+        def run():
+            for search_terms, t9_search in searches:
+                Partner.get_contacts(0, 10, search_terms, t9_search=t9_search)
+
+        indexed = self._time(run)
+        for column in CONTACT_SEARCH_COLUMNS:
+            self.env.cr.execute(SQL("DROP INDEX IF EXISTS %s", SQL.identifier(f"res_partner_voip_{column}_trgm_idx")))
+        scanned = self._time(run, rounds=1)
+        _logger.info(
+            "get_contacts over 500k partners, %d searches: trigram indexes %.1f ms, sequential scans %.1f ms",
+            len(searches), indexed * 1000, scanned * 1000,
+        )
+
+    def test_t9_encoding_throughput(self):
+        rng = random.Random(42)
+        alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ 0123456789-.'éèçñüÉØßæœ"
+        names = ["".join(rng.choice(alphabet) for _i in range(rng.randint(5, 40))) for _j in range(100000)]
+        self.assertEqual([t9_encode(name) for name in names[:1000]], [legacy_t9_encode(name) for name in names[:1000]])
+
+        t9_encode.cache_clear()
+        legacy = self._time(lambda: [legacy_t9_encode(name) for name in names], rounds=1)
+        translated = self._time(lambda: [t9_encode(name) for name in names], rounds=1)
+        _logger.info(
+            "T9 encoding of 100k names: per letter %.0f names/s, translate table %.0f names/s",
+            len(names) / legacy, len(names) / translated,
+        )
+
+        partners = self.env["res.partner"].create([{"name": name} for name in names[:20000]])
+        self.env.cr.execute("UPDATE res_partner SET t9_name = NULL WHERE id IN %s", [tuple(partners.ids)])
+        t9_encode.cache_clear()
+        start = time.perf_counter()
+        self.env["res.partner"]._voip_fill_t9_names()
+        _logger.info("Batched fill of 20k T9 names: %.0f partners/s", len(partners) / (time.perf_counter() - start))
+
+    def test_extract_country_code_cost(self):
+        rng = random.Random(42)
+        prefixes = ["+32", "+33", "+44", "+1", "+49", "+212", "+380", "0032", "+3", ""]
+        distinct = [f"{rng.choice(prefixes)}{rng.randint(10 ** 3, 10 ** 9)}" for _i in range(10000)]
+        # Call and partner lists show the same numbers over and over
+        numbers = [rng.choice(distinct) for _i in range(100000)]
+
+        uncached = self._time(lambda: [_extract_country_code.__wrapped__(number) for number in numbers], rounds=1)
+        _extract_country_code.cache_clear()
+        cached = self._time(lambda: [extract_country_code(number) for number in numbers], rounds=1)
+        _logger.info(
+            "extract_country_code on 100k numbers: %.2f us per call uncached, %.2f us cached (%d%% hits)",
+            uncached * 1e6 / len(numbers), cached * 1e6 / len(numbers),
+            100 * _extract_country_code.cache_info().hits / len(numbers),
+        )
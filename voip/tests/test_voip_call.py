@@ -119,3 +119,14 @@ class TestVoipCall(TransactionCase):
 
         self.assertEqual(store_data["res.partner"][0]["name"], caller.partner_id.name)
         self.assertEqual(store_data["voip.call"][0]["partner_id"], caller.partner_id.id)
+
+    def test_call_count_counts_calls_sharing_number_or_partner(self):
+        partner = self.env["res.partner"].create({"name": "Frequent caller"})
+        calls = self.env["voip.call"].create([
+            {"phone_number": "+3247001", "partner_id": partner.id},
+            {"phone_number": "+3247001", "partner_id": partner.id},
+            {"phone_number": "+3247001"},
+            {"phone_number": "+3247002", "partner_id": partner.id},
+            {"phone_number": "+3247003"},
+        ])
+        self.assertEqual(calls.mapped("call_count"), [4, 4, 3, 3, 1])
@@ -0,0 +1,48 @@
+from unittest import skipIf
+
+from odoo.tests import common, tagged
+
+from odoo.addons.voip.models.utils import extract_country_code, phonenumbers
+
+
+@tagged("voip", "post_install", "-at_install")
+@skipIf(not phonenumbers, "phonenumbers is not installed")
+class TestVoipCountryCode(common.TransactionCase):
+    def test_extract_country_code(self):
+        self.assertEqual(extract_country_code("+32 470 12 34 56"), {"iso": "be", "itu": "32"})
+        # Partial numbers are matched on their dialing prefix, if it identifies a single region
+        self.assertEqual(extract_country_code("+32"), {"iso": "be", "itu": "32"})
+        self.assertEqual(extract_country_code("00351"), {"iso": "pt", "itu": "351"})
+        self.assertEqual(extract_country_code("+1"), {"iso": "", "itu": ""})
+        self.assertEqual(extract_country_code("0470"), {"iso": "", "itu": ""})
+
+    def test_cached_result_is_not_shared(self):
+        extract_country_code("+32")["iso"] = "fr"
+        self.assertEqual(extract_country_code("+32")["iso"], "be")
+
+    def test_stored_country_code_follows_the_phone(self):
+        partner = self.env["res.partner"].create({"name": "Traveller", "phone": "+32 470 12 34 56"})
+        self.assertEqual(partner.country_code_from_phone, "be")
+        partner.phone = "+33 6 12 34 56 78"
+        self.assertEqual(partner.country_code_from_phone, "fr")
+        self.assertIn(partner, self.env["res.partner"].search([("country_code_from_phone", "=", "fr")]))
+
+    def test_country_codes_are_filled_in_batches(self):
+        calls = self.env["voip.call"].create([
+            {"phone_number": "+32 470 12 34 56"},
+            {"phone_number": "+33 6 12 34 56 78"},
+            {"phone_number": "8888"},
+        ])
+        self.env.cr.execute("UPDATE voip_call SET country_code_from_phone = NULL WHERE id IN %s", [tuple(calls.ids)])
+        calls.invalidate_recordset(["country_code_from_phone"])
+        self.env["voip.call"]._voip_fill_country_codes(["phone_number"], batch_size=2)
+        self.assertEqual(calls.mapped("country_code_from_phone"), ["be", "fr", ""])
+
+    def test_records_without_number_are_filled(self):
+        Partner = self.env["res.partner"]
+        partner = Partner.create({"name": "Unreachable"})
+        self.env.cr.execute("UPDATE res_partner SET country_code_from_phone = NULL WHERE id = %s", [partner.id])
+        partner.invalidate_recordset(["country_code_from_phone"])
+        Partner._voip_fill_country_codes(Partner._voip_get_country_code_fields())
+        self.env.cr.execute("SELECT country_code_from_phone FROM res_partner WHERE id = %s", [partner.id])
+        self.assertEqual(self.env.cr.fetchone()[0], "")
@@ -19,3 +19,14 @@ class TestVoipT9(common.TransactionCase):
         self.assertEqual(shrek.t9_name, " 74735")
         self.assertEqual(pangram.t9_name, " 843 78425 27696 369 58677 6837 843 5299 364")
         self.assertEqual(oenone.t9_name, " 636663")
+
+    def test_t9_name_is_filled_in_batches(self):
+        """
+        Tests that partners without T9 name, e.g. created before the module
+        was installed, get one from the batched fill.
+        """
+        partners = self.env["res.partner"].create([{"name": "Alice"}, {"name": "Bob"}, {"name": "Ève"}])
+        self.env.cr.execute("UPDATE res_partner SET t9_name = NULL WHERE id IN %s", [tuple(partners.ids)])
+        partners.invalidate_recordset(["t9_name"])
+        self.env["res.partner"]._voip_fill_t9_names(batch_size=2)
+        self.assertEqual(partners.mapped("t9_name"), [" 25423", " 262", " 383"])
@@ -1,6 +1,6 @@
 {
     'name': 'WhatsApp Integration',
-    'version': '19.0.1.0.0',
+    'version': '19.0.1.1.0',
     'summary': 'WhatsApp Integration for Odoo 19',
     'category': 'Tools',
     'author': 'Engelbert Rodriguez',
@@ -16,7 +16,12 @@
         'views/crm_lead_views.xml',
         'views/hr_recruitment_views.xml',
         'views/whatsapp_group_views.xml',
+        'views/whatsapp_outbound_views.xml',
+        'views/whatsapp_inbound_views.xml',
+        'views/whatsapp_broadcast_views.xml',
+        'data/whatsapp_data.xml',
         'data/user_assignment.xml',
+        'data/ir_cron.xml',
     ],
     'demo': [],
     'installable': True,
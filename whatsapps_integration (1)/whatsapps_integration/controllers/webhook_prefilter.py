@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap checks on the raw body of Evolution webhooks.
+
+Most deliveries are presence updates, receipts and connection events, and
+`messages.upsert` bodies may embed whole media as base64. The webhook body
+is first scanned as bytes to reject what would be ignored anyway, the JSON
+is only parsed for the payloads that may hold a message to ingest.
+
+The scan is conservative: it only rejects a body when the full parse would
+have ignored it too, anything ambiguous goes through the full parse.
+"""
+import re
+
+# The event name comes first in Evolution payloads, only the head is scanned for the logs
+EVENT_SCAN_BYTES = 4096
+_EVENT_RE = re.compile(rb'"(?:event|type)"\s*:\s*"([^"\\]{0,64})"')
+UPSERT_MARKER = b'"messages.upsert"'
+# Message keys and their fromMe flags, matched in a single pass over the body
+_KEY_OR_FLAG_RE = re.compile(rb'"(key|fromMe)"\s*:\s*(\{|true|false)')
+
+
+def peek_event(raw_body):
+    """Event name found at the head of the body, for logging. Returns None if not found."""
+    match = _EVENT_RE.search(raw_body, 0, EVENT_SCAN_BYTES)
+    return match.group(1).decode('utf-8', 'replace') if match else None
+
+
+def prefilter(raw_body):
+    """Tell whether a webhook body can be ignored without parsing it.
+
+    Returns the reason of the rejection, 'not_upsert' or 'from_me', as the
+    full parse would report it, or None if the body must be parsed.
+    """
+    if UPSERT_MARKER not in raw_body:
+        # Whatever the event is, it is not a message
+        return 'not_upsert'
+    # Only our own messages: every message key has a fromMe flag, and all are set
+    keys = own = 0
+    for match in _KEY_OR_FLAG_RE.finditer(raw_body):
+        value = match.group(2)
+        if value == b'false':
+            # Keys come before the message content, incoming messages stop early
+            return None
+        if value == b'true':
+            own += 1
+        elif match.group(1) == b'key':
+            keys += 1
+    if own and own >= keys:
+        return 'from_me'
+    return None
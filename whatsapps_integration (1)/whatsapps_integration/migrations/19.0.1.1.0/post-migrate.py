@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Bind the group guest data record to the guest partner of earlier versions.
+
+Earlier versions looked the guest up by name, and created it on the first
+group message. Loading the data file created a second guest partner, the
+existing one takes over its xmlid so that old and new messages share it.
+"""
+import logging
+
+from odoo import SUPERUSER_ID, api
+
+_logger = logging.getLogger(__name__)
+
+GROUP_GUEST_NAME = 'WhatsApp Group Guest'
+
+
+def _bind_group_guest(env):
+    data = env['ir.model.data'].search([
+        ('module', '=', 'whatsapps_integration'),
+        ('name', '=', 'partner_whatsapp_group_guest'),
+    ])
+    if not data:
+        return
+    new_guest = env['res.partner'].browse(data.res_id)
+    old_guest = env['res.partner'].search([
+        ('name', '=', GROUP_GUEST_NAME),
+        ('id', '<', new_guest.id),
+    ], order='id', limit=1)
+    if not old_guest:
+        return
+    _logger.info("Binding the WhatsApp group guest xmlid to partner %s", old_guest.id)
+    data.res_id = old_guest.id
+    env['mail.message'].search([('author_id', '=', new_guest.id)]).author_id = old_guest
+    new_guest.unlink()
+    env.registry.clear_cache()
+
+
+def migrate(cr, version):
+    _bind_group_guest(api.Environment(cr, SUPERUSER_ID, {}))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Prepare the unique indexes declared with `models.Constraint`.
+
+The former `_sql_constraints` were never created under Odoo 19, the tables
+may hold rows the new indexes would reject, and creating them would fail.
+"""
+import logging
+from collections import defaultdict
+
+from odoo.tools.sql import column_exists, table_exists
+
+from odoo.addons.whatsapps_integration.models.utils import normalize_whatsapp_number
+
+_logger = logging.getLogger(__name__)
+
+
+def _merge_whatsapp_channels(cr):
+    """Normalize `discuss_channel.whatsapp_number` and merge the channels of a same number.
+
+    The oldest channel is kept, the messages, attachments and members of the
+    others are moved to it before they are deleted.
+    """
+    if not column_exists(cr, 'discuss_channel', 'whatsapp_number'):
+        return
+    cr.execute("SELECT id, whatsapp_number FROM discuss_channel WHERE whatsapp_number IS NOT NULL ORDER BY id")
+    channel_ids_by_number = defaultdict(list)
+    renumbered = []
+    for channel_id, number in cr.fetchall():
+        normalized = normalize_whatsapp_number(number) or None
+        if normalized != number:
+            renumbered.append((channel_id, normalized))
+        if normalized:
+            channel_ids_by_number[normalized].append(channel_id)
+
+    for number, channel_ids in channel_ids_by_number.items():
+        keep_id, duplicate_ids = channel_ids[0], channel_ids[1:]
+        if not duplicate_ids:
+            continue
+        _logger.info("Merging WhatsApp channels %s of %s into channel %s", duplicate_ids, number, keep_id)
+        cr.execute("""
+            UPDATE mail_message
+               SET res_id = %s
+             WHERE model = 'discuss.channel' AND res_id = ANY(%s)
+        """, [keep_id, duplicate_ids])
+        cr.execute("""
+            UPDATE ir_attachment
+               SET res_id = %s
+             WHERE res_model = 'discuss.channel' AND res_id = ANY(%s)
+        """, [keep_id, duplicate_ids])
+        for duplicate_id in duplicate_ids:
+            # One channel at a time, so that a partner member of several duplicates is moved once
+            cr.execute("""
+                UPDATE discuss_channel_member member
+                   SET channel_id = %s
+                 WHERE channel_id = %s
+                   AND NOT EXISTS (
+                           SELECT 1
+                             FROM discuss_channel_member kept
+                            WHERE kept.channel_id = %s
+                              AND kept.partner_id IS NOT DISTINCT FROM member.partner_id
+                              AND kept.guest_id IS NOT DISTINCT FROM member.guest_id
+                       )
+            """, [keep_id, duplicate_id, keep_id])
+        for table, column in (('whatsapp_group', 'active_channel_id'), ('whatsapp_outbound_message', 'channel_id')):
+            if table_exists(cr, table):
+                cr.execute(f"UPDATE {table} SET {column} = %s WHERE {column} = ANY(%s)", [keep_id, duplicate_ids])
+        cr.execute("DELETE FROM discuss_channel WHERE id = ANY(%s)", [duplicate_ids])
+
+    merged = {channel_id for channel_ids in channel_ids_by_number.values() for channel_id in channel_ids[1:]}
+    for channel_id, normalized in renumbered:
+        if channel_id not in merged:
+            cr.execute("UPDATE discuss_channel SET whatsapp_number = %s WHERE id = %s", [normalized, channel_id])
+
+
+def _merge_whatsapp_groups(cr):
+    """Merge the groups of a same `whatsapp_group.whatsapp_id`.
+
+    The accepted group is kept over the pending and rejected ones, then the
+    oldest. Its chatter, followers and linked channel are completed with
+    those of the others before they are deleted.
+    """
+    if not table_exists(cr, 'whatsapp_group'):
+        return
+    cr.execute("""
+        SELECT whatsapp_id, ARRAY_AGG(id ORDER BY status = 'accepted' DESC, status = 'pending' DESC, id)
+          FROM whatsapp_group
+      GROUP BY whatsapp_id
+        HAVING COUNT(*) > 1
+    """)
+    for jid, group_ids in cr.fetchall():
+        keep_id, duplicate_ids = group_ids[0], group_ids[1:]
+        _logger.info("Merging WhatsApp groups %s of %s into group %s", duplicate_ids, jid, keep_id)
+        for table, column in (('mail_message', 'model'), ('mail_activity', 'res_model'), ('ir_attachment', 'res_model')):
+            cr.execute(f"""
+                UPDATE {table}
+                   SET res_id = %s
+                 WHERE {column} = 'whatsapp.group' AND res_id = ANY(%s)
+            """, [keep_id, duplicate_ids])
+        for duplicate_id in duplicate_ids:
+            # One group at a time, so that a partner following several duplicates is moved once
+            cr.execute("""
+                UPDATE mail_followers follower
+                   SET res_id = %s
+                 WHERE res_model = 'whatsapp.group' AND res_id = %s
+                   AND NOT EXISTS (
+                           SELECT 1
+                             FROM mail_followers kept
+                            WHERE kept.res_model = 'whatsapp.group'
+                              AND kept.res_id = %s
+                              AND kept.partner_id = follower.partner_id
+                       )
+            """, [keep_id, duplicate_id, keep_id])
+        cr.execute("DELETE FROM mail_followers WHERE res_model = 'whatsapp.group' AND res_id = ANY(%s)", [duplicate_ids])
+        cr.execute("""
+            UPDATE whatsapp_group kept
+               SET active_channel_id = (
+                       SELECT active_channel_id
+                         FROM whatsapp_group
+                        WHERE id = ANY(%s) AND active_channel_id IS NOT NULL
+                     ORDER BY id
+                        LIMIT 1
+                   )
+             WHERE id = %s AND active_channel_id IS NULL
+        """, [duplicate_ids, keep_id])
+        cr.execute("DELETE FROM whatsapp_group WHERE id = ANY(%s)", [duplicate_ids])
+
+
+def migrate(cr, version):
+    _merge_whatsapp_channels(cr)
+    _merge_whatsapp_groups(cr)
@@ -6,3 +6,10 @@ from . import crm_lead
 from . import hr_applicant
 from . import res_config_settings
 from . import whatsapp_group
+from . import whatsapp_outbound_message
+from . import whatsapp_inbound_event
+from . import whatsapp_message_dedup
+from . import ir_attachment
+from . import whatsapp_avatar_cache
+from . import whatsapp_broadcast
+from . import whatsapp_circuit_breaker
@@ -1,11 +1,130 @@
 # -*- coding: utf-8 -*-
+import psycopg2
+
 from odoo import models, fields, api
+from odoo.exceptions import ConcurrencyError, MissingError
+
+from .utils import LRUCache, get_or_create, normalize_whatsapp_number
+
+# (dbname, whatsapp_number) -> channel id, only positive answers are cached
+_channel_id_by_number = LRUCache(maxsize=20000)
+
 
 class DiscussChannel(models.Model):
     _inherit = 'discuss.channel'
 
     channel_type = fields.Selection(selection_add=[('whatsapp', 'WhatsApp Conversation')], ondelete={'whatsapp': 'cascade'})
-    whatsapp_number = fields.Char(string="WhatsApp Number")
+    whatsapp_number = fields.Char(string="WhatsApp Number", index=True, help="Group JID, or E.164 digits for private chats")
+
+    # Existing duplicates are merged by the 19.0.1.1.0 migration
+    _whatsapp_number_unique = models.Constraint(
+        'unique(whatsapp_number)',
+        'A WhatsApp conversation already exists for this number.',
+    )
+
+    @api.model
+    def _whatsapp_resolve_channel_id(self, identifier):
+        """Return the id of the channel of a JID or phone number, or False.
+
+        Answers from the per-worker LRU are checked against the channel's
+        number, which the caller reads anyway, so a channel renamed or
+        deleted in another worker is never returned.
+        """
+        number = normalize_whatsapp_number(identifier)
+        if not number:
+            return False
+        cache_key = (self.env.cr.dbname, number)
+        channel_id = _channel_id_by_number.get(cache_key)
+        if channel_id:
+            try:
+                if self.browse(channel_id).whatsapp_number == number:
+                    return channel_id
+            except MissingError:
+                pass
+            _channel_id_by_number.pop(cache_key)
+
+        channel = self.search([('whatsapp_number', '=', number)], limit=1)
+        if channel:
+            _channel_id_by_number.set(cache_key, channel.id)
+        return channel.id
+
+    @api.model
+    def _whatsapp_get_or_create_channel(self, identifier, make_vals):
+        """Return the channel of a JID or phone number, creating it from `make_vals()` if there is none.
+
+        Concurrent creations are serialized, see `get_or_create`.
+        """
+        number = normalize_whatsapp_number(identifier)
+
+        def create():
+            try:
+                with self.env.cr.savepoint():
+                    return self.create(dict(make_vals(), whatsapp_number=number))
+            except psycopg2.errors.UniqueViolation:
+                # Created without the lock (e.g. from the UI), retry to pick it up
+                raise ConcurrencyError(f"WhatsApp channel {number} was created concurrently")
+
+        return get_or_create(
+            self.env, f'whatsapp.channel:{number}',
+            lambda env: self.with_env(env).browse(self.with_env(env)._whatsapp_resolve_channel_id(number)),
+            create,
+        )
+
+    def _whatsapp_is_member(self, partner_id):
+        """Whether `partner_id` is a member of this channel.
+
+        Answered by the (channel_id, partner_id) unique index of the members,
+        without loading the members of the channel.
+        """
+        self.ensure_one()
+        self.env['discuss.channel.member'].flush_model(['channel_id', 'partner_id'])
+        self.env.cr.execute("""
+            SELECT 1
+              FROM discuss_channel_member
+             WHERE channel_id = %s AND partner_id = %s
+             LIMIT 1
+        """, [self.id, partner_id])
+        return bool(self.env.cr.fetchone())
+
+    def _whatsapp_add_member(self, partner_id):
+        """Add `partner_id` to this channel unless it is already a member. Returns True if added.
+
+        Safe under concurrent webhooks: a member inserted meanwhile by another
+        transaction makes the unique index reject ours, which is then ignored.
+        """
+        self.ensure_one()
+        if self._whatsapp_is_member(partner_id):
+            return False
+        try:
+            with self.env.cr.savepoint():
+                self.env['discuss.channel.member'].sudo().create({'channel_id': self.id, 'partner_id': partner_id})
+        except psycopg2.errors.UniqueViolation:
+            return False
+        return True
+
+    def _whatsapp_forget_numbers(self):
+        dbname = self.env.cr.dbname
+        for channel in self:
+            if channel.whatsapp_number:
+                _channel_id_by_number.pop((dbname, channel.whatsapp_number))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('whatsapp_number'):
+                vals['whatsapp_number'] = normalize_whatsapp_number(vals['whatsapp_number'])
+                _channel_id_by_number.pop((self.env.cr.dbname, vals['whatsapp_number']))
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if 'whatsapp_number' in vals:
+            vals['whatsapp_number'] = normalize_whatsapp_number(vals['whatsapp_number'])
+            self._whatsapp_forget_numbers()
+        return super().write(vals)
+
+    def unlink(self):
+        self._whatsapp_forget_numbers()
+        return super().unlink()
 
     def message_post(self, **kwargs):
         """Override to intercept messages sent to WhatsApp channels."""
@@ -38,6 +157,10 @@ class DiscussChannel(models.Model):
                  
                  caption_to_use = clean_text
                  
+                 # Messages are queued and sent by the dispatcher cron after commit,
+                 # so posting never waits for the Evolution API.
+                 queue_vals = []
+
                  # 1. Handle Attachments
                  if message.attachment_ids:
                      for i, attachment in enumerate(message.attachment_ids):
@@ -50,21 +173,20 @@ class DiscussChannel(models.Model):
                          elif 'audio' in mime:
                              media_type = 'audio'
                          
-                         media_base64 = attachment.datas.decode('utf-8') if attachment.datas else ''
-                         
                          # Use body as caption for the FIRST attachment only, and only if it exists
                          # If there are multiple attachments, only the first gets the caption (standard behavior)
                          # OR we could repeat it, but that's annoying.
                          caption = caption_to_use if i == 0 else ''
                          
-                         self.env['whatsapp.evolution.api'].send_media(
-                            phone=self.whatsapp_number,
-                            media_type=media_type,
-                            media_base64=media_base64,
-                            caption=caption,
-                            file_name=attachment.name,
-                            mimetype=mime
-                         )
+                         queue_vals.append({
+                            'channel_id': self.id,
+                            'message_id': message.id,
+                            'recipient': self.whatsapp_number,
+                            'message_kind': 'media',
+                            'media_type': media_type,
+                            'attachment_id': attachment.id,
+                            'body': caption,
+                         })
                      
                      # If we sent attachments, we assume the body was consumed as caption (or was just "Sent attachment")
                      # So we clear it to prevent sending a duplicate text message
@@ -74,7 +196,16 @@ class DiscussChannel(models.Model):
                  # In this logic, if attachments exist, we consumed the text as caption.
                  # This prevents the "Sent attachment: ..." separate message.
                  if clean_text:
-                     self.env['whatsapp.evolution.api'].send_message(self.whatsapp_number, clean_text)
+                     queue_vals.append({
+                        'channel_id': self.id,
+                        'message_id': message.id,
+                        'recipient': self.whatsapp_number,
+                        'message_kind': 'text',
+                        'body': clean_text,
+                     })
+
+                 if queue_vals:
+                     self.env['whatsapp.outbound.message'].sudo()._enqueue(queue_vals)
         
         return message
 
@@ -98,8 +229,8 @@ class DiscussChannel(models.Model):
         elif phone:
             # Clean phone
             phone = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-            # Search partner by mobile
-            partner = Partner.search(['|', ('mobile', '=', phone), ('phone', '=', phone)], limit=1)
+            # Search partner by mobile or phone
+            partner = Partner.browse(Partner._whatsapp_resolve_partner_id(phone))
             if not partner and name:
                 partner = Partner.create({
                     'name': name,
@@ -138,32 +269,20 @@ class DiscussChannel(models.Model):
                 }
             }
             
-        # Normalize mobile for channel identifier (simple version)
-        # Use simple regex or filter to keep only digits
-        import re
-        target_number = re.sub(r'\D', '', mobile)
-        
-        # Find existing channel
-        channel = self.search([
-            ('whatsapp_number', '=', target_number)
-        ], limit=1)
+        # Normalize mobile for channel identifier (E.164 digits)
+        target_number = normalize_whatsapp_number(mobile)
         
-        if not channel:
-            channel = self.create({
-                'name': f'{partner.name} (WhatsApp)',
-                'channel_type': 'channel',
-                'whatsapp_number': target_number,
-                'channel_member_ids': [
-                    (0, 0, {'partner_id': partner.id}),
-                    (0, 0, {'partner_id': self.env.user.partner_id.id}),
-                ]
-            })
-        else:
-            # Ensure current user is a member
-            if self.env.user.partner_id not in channel.channel_member_ids.partner_id:
-                channel.write({
-                    'channel_member_ids': [(0, 0, {'partner_id': self.env.user.partner_id.id})]
-                })
+        # Find existing channel, or create it
+        channel = self._whatsapp_get_or_create_channel(target_number, lambda: {
+            'name': f'{partner.name} (WhatsApp)',
+            'channel_type': 'channel',
+            'channel_member_ids': [
+                (0, 0, {'partner_id': partner.id}),
+                (0, 0, {'partner_id': self.env.user.partner_id.id}),
+            ]
+        })
+        # Ensure current user is a member
+        channel._whatsapp_add_member(self.env.user.partner_id.id)
 
         return {
             'type': 'ir.actions.client',
@@ -1,87 +1,327 @@
 # -*- coding: utf-8 -*-
 import requests
+import io
 import json
 import logging
-from odoo import models, api, _
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from odoo import models, api, tools, _
 from odoo.exceptions import UserError
 
+from .evolution_media import (
+    DEFAULT_MEDIA_MAX_BYTES, Base64JsonBody, Base64StreamDecoder, MediaTooLarge,
+    copy_limited, iter_json_string_field, new_spooled_file,
+)
+from .evolution_breaker import (
+    DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_SECONDS, EvolutionUnavailable, GuardedSession, get_breaker,
+)
+from .evolution_session import DEFAULT_POOL_SIZE, get_session
+from .utils import LRUCache
+
 _logger = logging.getLogger(__name__)
 
+# Media downloads of a webhook batch: worker threads, and concurrent downloads per host
+MEDIA_MAX_WORKERS = 8
+MEDIA_HOST_CONCURRENCY = 4
+
+DEFAULT_AVATAR_TTL_HOURS = 24
+
+# Milliseconds Evolution shows the "typing" presence before sending a text
+DEFAULT_SEND_DELAY = 1200
+MEDIA_BASE64_FIELDS = ('base64', 'data')
+
+# sendText payload shapes, in probing order, and how long the accepted one is trusted
+TEXT_DIALECTS = ('text', 'text_message')
+TEXT_DIALECT_TTL = 3600
+# (base_url, instance) -> (dialect, expiry), per worker
+_text_dialects = LRUCache(maxsize=64)
+_text_dialect_stats = {'hits': 0, 'misses': 0, 'reprobes': 0}
+
+# Config parameters backing `EvolutionConfig`, writing any of them through the
+# settings invalidates the cached config.
+CONFIG_PARAMS = (
+    'whatsapp.evolution_api_url',
+    'whatsapp.evolution_api_token',
+    'whatsapp.evolution_instance_name',
+    'whatsapp.evolution_pool_size',
+    'whatsapp.evolution_media_max_mb',
+    'whatsapp.evolution_media_by_url',
+    'whatsapp.evolution_avatar_ttl_hours',
+    'whatsapp.evolution_breaker_threshold',
+    'whatsapp.evolution_breaker_reset_seconds',
+)
+
+ENDPOINT_TEMPLATES = {
+    'send_text': '{base_url}/message/sendText/{instance}',
+    'send_media': '{base_url}/message/sendMedia/{instance}',
+    'get_media_base64': '{base_url}/chat/getBase64FromMediaMessage/{instance}',
+    'connection_state': '{base_url}/instance/connectionState/{instance}',
+    'fetch_all_groups': '{base_url}/group/fetchAllGroups/{instance}?getParticipants=false',
+    'fetch_profile_picture': '{base_url}/chat/fetchProfilePictureUrl/{instance}',
+}
+
+
+class EvolutionConfig(NamedTuple):
+    """Immutable, preassembled Evolution API configuration."""
+    base_url: str
+    token: str
+    instance: str
+    headers: MappingProxyType
+    endpoints: MappingProxyType
+    pool_size: int
+    media_max_bytes: int
+    media_by_url: bool
+    avatar_ttl_hours: int
+    breaker_threshold: int
+    breaker_reset_seconds: int
+
+
+def _text_payload(dialect, number, message, delay):
+    if dialect == 'text_message':
+        # Older v2 instances want a "textMessage" object
+        return {
+            "number": number,
+            "textMessage": {"text": message},
+            "options": {"delay": delay, "presence": "composing"}
+        }
+    # Evolution API v2.3.7 accepts 'text' at root
+    # Simplified payload to avoid schema validation errors with 'options'
+    return {
+        "number": number,
+        "text": message,
+        "delay": delay,
+        "linkPreview": False
+    }
+
+
+def get_text_dialect_stats():
+    """Hits and misses of the sendText dialect cache of the current worker."""
+    return dict(_text_dialect_stats, size=len(_text_dialects))
+
+
+def _send_text(config, session, phone, message, delay=DEFAULT_SEND_DELAY):
+    """Send a text message. Does not touch the environment, so that it can run in a worker thread.
+
+    The payload shape accepted by the instance is cached, steady-state sends
+    take one request. The other shape is only tried when the server answers
+    400, and the cache follows whichever shape succeeded.
+    """
+    endpoint = config.endpoints['send_text']
+    
+    # Determine if it's a group or private number
+    if '@g.us' in phone:
+        clean_phone = phone # Use as-is for groups
+    else:
+        # Ensure only digits are sent for private numbers
+        clean_phone = re.sub(r'\D', '', phone)
+
+    cache_key = (config.base_url, config.instance)
+    cached = _text_dialects.get(cache_key)
+    if cached and cached[1] > time.monotonic():
+        _text_dialect_stats['hits'] += 1
+        dialect = cached[0]
+    else:
+        _text_dialect_stats['misses'] += 1
+        dialect = TEXT_DIALECTS[0]
+    dialects = [dialect] + [d for d in TEXT_DIALECTS if d != dialect]
+
+    error = None
+    for attempt, dialect in enumerate(dialects):
+        payload = _text_payload(dialect, clean_phone, message, delay)
+        try:
+            response = session.post(endpoint, endpoint='send_text', headers=config.headers, json=payload)
+            response.raise_for_status()
+            _text_dialects.set(cache_key, (dialect, time.monotonic() + TEXT_DIALECT_TTL))
+            return response.json()
+        except EvolutionUnavailable:
+            # Fail fast, the caller keeps the message for later
+            raise
+        except requests.exceptions.RequestException as e:
+            error = error or e
+            # Only a 400 may mean the other payload shape is expected
+            if not (isinstance(e, requests.exceptions.HTTPError) and e.response.status_code == 400):
+                break
+            if attempt + 1 < len(dialects):
+                _text_dialect_stats['reprobes'] += 1
+                _logger.warning("sendText answered 400 to the %s payload, retrying with %s...", dialect, dialects[attempt + 1])
+    
+    _logger.error("Failed to send WhatsApp message to %s: %s", phone, str(error))
+    return {'error': str(error)}
+
+
+def _media_source(config, message_object):
+    """URL the media of a webhook message is downloaded from."""
+    return message_object.get('message', {}).get('mediaUrl') or config.endpoints['get_media_base64']
+
+
+def _download_media(config, session, message_object):
+    """Stream the media of a webhook message into a temporary file.
+
+    Does not touch the environment, so that it can run in a worker thread.
+    Returns the file positioned at 0, or None if the download failed.
+    """
+    media_url = message_object.get('message', {}).get('mediaUrl')
+    media_file = new_spooled_file()
+    try:
+        if media_url:
+            _logger.info("Streaming media from: %s", media_url)
+            with session.get(media_url, endpoint='download', stream=True) as response:
+                response.raise_for_status()
+                length = int(response.headers.get('Content-Length') or 0)
+                if length > config.media_max_bytes:
+                    raise MediaTooLarge(f"Media of {length} bytes exceeds the limit of {config.media_max_bytes} bytes")
+                copy_limited(response.iter_content(chunk_size=64 * 1024), media_file, config.media_max_bytes)
+        else:
+            payload = {
+                "message": message_object,
+                "convertToMp4": False
+            }
+            with session.post(config.endpoints['get_media_base64'], endpoint='get_media_base64',
+                              headers=config.headers, json=payload, stream=True) as response:
+                response.raise_for_status()
+                decoder = Base64StreamDecoder(media_file, config.media_max_bytes)
+                # Depending on their version, instances answer with 'base64' or 'data'
+                chunks = response.iter_content(chunk_size=64 * 1024)
+                for piece in iter_json_string_field(chunks, MEDIA_BASE64_FIELDS):
+                    decoder.feed(piece)
+                decoder.close()
+        media_file.seek(0)
+        return media_file
+    except (MediaTooLarge, EvolutionUnavailable):
+        media_file.close()
+        raise
+    except (requests.exceptions.RequestException, ValueError) as e:
+        media_file.close()
+        _logger.error("Failed to retrieve media: %s", str(e))
+        return None
+
+
 class EvolutionApi(models.AbstractModel):
     _name = 'whatsapp.evolution.api'
     _description = 'Evolution API Service'
 
     @api.model
-    def _get_api_config(self):
-        """Retrieve API configuration from settings."""
+    @tools.ormcache()
+    def _get_config(self):
+        """Return the cached `EvolutionConfig` of this database, or None if not configured.
+
+        The ormcache lives in the registry, so the config is cached once per
+        database and worker, and cleared in every worker when the settings change.
+        """
         params = self.env['ir.config_parameter'].sudo()
         url = params.get_param('whatsapp.evolution_api_url')
         token = params.get_param('whatsapp.evolution_api_token')
-        instance = params.get_param('whatsapp.evolution_instance_name') or 'Odoo'
-        
         if not url or not token:
-             # Option to log warning but not crash if used loosely, but better to enforce for sending
-             return None, None, None
-        
+            return None
+        instance = params.get_param('whatsapp.evolution_instance_name') or 'Odoo'
+        try:
+            pool_size = int(params.get_param('whatsapp.evolution_pool_size') or DEFAULT_POOL_SIZE)
+        except ValueError:
+            pool_size = DEFAULT_POOL_SIZE
+        try:
+            media_max_mb = int(params.get_param('whatsapp.evolution_media_max_mb') or 0)
+        except ValueError:
+            media_max_mb = 0
+        try:
+            avatar_ttl_hours = int(params.get_param('whatsapp.evolution_avatar_ttl_hours') or DEFAULT_AVATAR_TTL_HOURS)
+        except ValueError:
+            avatar_ttl_hours = DEFAULT_AVATAR_TTL_HOURS
+        try:
+            breaker_threshold = int(params.get_param('whatsapp.evolution_breaker_threshold') or DEFAULT_FAILURE_THRESHOLD)
+            breaker_reset_seconds = int(params.get_param('whatsapp.evolution_breaker_reset_seconds') or DEFAULT_RESET_SECONDS)
+        except ValueError:
+            breaker_threshold, breaker_reset_seconds = DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_SECONDS
+
         # Ensure URL doesn't end with slash to avoid double slashes
-        return url.rstrip('/'), token, instance
+        base_url = url.rstrip('/')
+        return EvolutionConfig(
+            base_url=base_url,
+            token=token,
+            instance=instance,
+            headers=MappingProxyType({
+                'Content-Type': 'application/json',
+                'apikey': token,
+            }),
+            endpoints=MappingProxyType({
+                name: template.format(base_url=base_url, instance=instance)
+                for name, template in ENDPOINT_TEMPLATES.items()
+            }),
+            pool_size=max(pool_size, 1),
+            media_max_bytes=media_max_mb * 1024 * 1024 if media_max_mb > 0 else DEFAULT_MEDIA_MAX_BYTES,
+            media_by_url=params.get_param('whatsapp.evolution_media_by_url') == 'True',
+            avatar_ttl_hours=max(avatar_ttl_hours, 0),
+            breaker_threshold=max(breaker_threshold, 1),
+            breaker_reset_seconds=max(breaker_reset_seconds, 1),
+        )
 
     @api.model
-    def send_message(self, phone, message):
-        """Send a text message via Evolution API."""
-        base_url, token, instance = self._get_api_config()
-        if not base_url:
-            raise UserError(_("Evolution API is not configured. Please check settings."))
+    def _clear_config_cache(self):
+        self.env.registry.clear_cache()
 
-        headers = {
-            'Content-Type': 'application/json',
-            'apikey': token
-        }
-        
-        endpoint = f"{base_url}/message/sendText/{instance}"
-        
-        # Determine if it's a group or private number
+    @api.model
+    def _get_api_config(self):
+        """Retrieve API configuration from settings."""
+        config = self._get_config()
+        if not config:
+             return None, None, None
+        return config.base_url, config.token, config.instance
+
+    @api.model
+    def _get_session(self, config=None):
+        """Return the pooled keep-alive session of the current worker, guarded by the circuit breaker."""
+        config = config or self._get_config()
+        if not config:
+            return get_session(pool_size=DEFAULT_POOL_SIZE)
+        return GuardedSession(get_session(pool_size=config.pool_size), self._get_breaker(config), config.base_url)
+
+    @api.model
+    def _get_breaker(self, config=None):
+        """Return the circuit breaker of the configured Evolution instance, or None."""
+        config = config or self._get_config()
+        if not config:
+            return None
+        return get_breaker(self.env.cr.dbname, f"{config.base_url}/{config.instance}",
+                           threshold=config.breaker_threshold, reset_seconds=config.breaker_reset_seconds)
+
+    @api.model
+    def _format_recipient(self, phone):
+        # Group JIDs are used as-is, private numbers are sent as digits only
         if '@g.us' in phone:
-            clean_phone = phone # Use as-is for groups
-        else:
-            # Ensure only digits are sent for private numbers
-            import re
-            clean_phone = re.sub(r'\D', '', phone)
-        
-        # Evolution API v2.3.7 often accepts 'text' at root or 'textMessage'
-        # Simplified payload to avoid schema validation errors with 'options'
-        payload = {
-            "number": clean_phone,
-            "text": message,
-            "delay": 1200,
-            "linkPreview": False
-        }
-        
-        # If the above 400s, it might need "textMessage": {"text": message} WITHOUT options
-        # But let's try this standard format first which works on many v2 instances.
+            return phone
+        import re
+        return re.sub(r'\D', '', phone)
 
-        try:
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            # Fallback for "textMessage" object requirement if 400
-            if isinstance(e, requests.exceptions.HTTPError) and e.response.status_code == 400:
-                try:
-                    _logger.warning("First attempt 400, retrying with textMessage object...")
-                    payload_v2 = {
-                        "number": clean_phone,
-                        "textMessage": {"text": message},
-                        "options": {"delay": 1200, "presence": "composing"}
-                    }
-                    response = requests.post(endpoint, headers=headers, json=payload_v2, timeout=10)
-                    response.raise_for_status()
-                    return response.json()
-                except Exception as e2:
-                    _logger.error("Retry failed: %s", str(e2))
-            
-            _logger.error("Failed to send WhatsApp message to %s: %s", phone, str(e))
-            return {'error': str(e)}
+    @api.model
+    def get_http_stats(self):
+        """Connection pool counters (hits, misses, retries) and sendText dialect cache counters of the current worker."""
+        return dict(self._get_session().stats(), text_dialect_cache=get_text_dialect_stats())
+
+    @api.model
+    def send_message(self, phone, message, delay=DEFAULT_SEND_DELAY):
+        """Send a text message via Evolution API.
+        :param delay: milliseconds Evolution shows the "typing" presence before sending
+        """
+        config = self._get_config()
+        if not config:
+            raise UserError(_("Evolution API is not configured. Please check settings."))
+        return _send_text(config, self._get_session(config), phone, message, delay=delay)
+
+    @api.model
+    def broadcast(self, records, body, name=None, **options):
+        """
+        Send a templated text message to many contacts or leads, in the background.
+        :param records: res.partner or crm.lead recordset
+        :param body: message template, rendered for each record (e.g. Hello {{ object.name }})
+        :param options: whatsapp.broadcast values, e.g. rate_per_minute, concurrency
+        :return: the running whatsapp.broadcast, to follow its progress
+        """
+        return self.env['whatsapp.broadcast'].sudo()._create_from_records(records, body, name=name, **options)
 
     @api.model
     def send_media(self, phone, media_type, media_base64, caption=None, file_name=None, mimetype=None):
@@ -94,16 +334,11 @@ class EvolutionApi(models.AbstractModel):
         :param file_name: Name of the file (important for documents)
         :param mimetype: Mime type of the file (e.g. image/jpeg)
         """
-        base_url, token, instance = self._get_api_config()
-        if not base_url:
+        config = self._get_config()
+        if not config:
              raise UserError(_("Evolution API is not configured."))
-
-        headers = {
-            'Content-Type': 'application/json',
-            'apikey': token
-        }
         
-        endpoint = f"{base_url}/message/sendMedia/{instance}"
+        endpoint = config.endpoints['send_media']
         
         # Determine if it's a group or private number
         if '@g.us' in phone:
@@ -129,12 +364,58 @@ class EvolutionApi(models.AbstractModel):
         }
         
         try:
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=30)
+            response = self._get_session(config).post(endpoint, endpoint='send_media', headers=config.headers, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             _logger.error("Failed to send WhatsApp media to %s: %s", phone, str(e))
             return {'error': str(e)}
+
+    @api.model
+    def send_attachment(self, phone, attachment, media_type, caption=None):
+        """
+        Send an ir.attachment as a media message without loading it as a base64 string.
+        The attachment is either referenced by a public URL (if enabled in the settings)
+        or streamed from the filestore into the request body.
+        :raise MediaTooLarge: if the attachment exceeds the configured media limit
+        """
+        config = self._get_config()
+        if not config:
+             raise UserError(_("Evolution API is not configured."))
+        attachment = attachment.sudo()
+        if attachment.file_size > config.media_max_bytes:
+            raise MediaTooLarge(f"{attachment.name} ({attachment.file_size} bytes) exceeds the limit of {config.media_max_bytes} bytes")
+
+        fields = {
+            "number": self._format_recipient(phone),
+            "mediatype": media_type,
+            "mimetype": attachment.mimetype or "",
+            "caption": caption or "",
+            "fileName": attachment.name,
+        }
+        if config.media_by_url:
+            # Evolution downloads the file itself, nothing goes through this worker
+            access_token = attachment.generate_access_token()[0]
+            fields['media'] = f"{attachment.get_base_url()}/web/content/{attachment.id}?access_token={access_token}&download=true"
+            request_kwargs = {'json': fields}
+        else:
+            if attachment.store_fname:
+                full_path = attachment._full_path(attachment.store_fname)
+                open_file = lambda: open(full_path, 'rb')
+            else:
+                raw = attachment.raw or b''
+                open_file = lambda: io.BytesIO(raw)
+            request_kwargs = {'data': Base64JsonBody(fields, open_file, attachment.file_size)}
+
+        try:
+            response = self._get_session(config).post(config.endpoints['send_media'], endpoint='send_media', headers=config.headers, **request_kwargs)
+            response.raise_for_status()
+            return response.json()
+        except EvolutionUnavailable:
+            raise
+        except requests.exceptions.RequestException as e:
+            _logger.error("Failed to send WhatsApp media to %s: %s", phone, str(e))
+            return {'error': str(e)}
             
     @api.model
     def get_media_base64(self, message_object):
@@ -142,17 +423,11 @@ class EvolutionApi(models.AbstractModel):
         Retrieve Base64 content from a media message using Evolution API.
         :param message_object: The full message dict from the webhook
         """
-        base_url, token, instance = self._get_api_config()
-        if not base_url:
+        config = self._get_config()
+        if not config:
             return None
 
-        headers = {
-            'Content-Type': 'application/json',
-            'apikey': token
-        }
-        
-        endpoint = f"{base_url}/chat/getBase64FromMediaMessage/{instance}"
-        
+        endpoint = config.endpoints['get_media_base64']
         payload = {
             "message": message_object,
             "convertToMp4": False # optional, but good for audio/stickers sometimes
@@ -160,7 +435,7 @@ class EvolutionApi(models.AbstractModel):
 
         try:
             _logger.info("Fetching media from: %s", endpoint)
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=30)
+            response = self._get_session(config).post(endpoint, endpoint='get_media_base64', headers=config.headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -183,58 +458,127 @@ class EvolutionApi(models.AbstractModel):
                  _logger.error("Response Content: %s", e.response.text)
             return None
 
+    @api.model
+    def get_media_file(self, message_object):
+        """
+        Download the media of a webhook message into a temporary file, decoding on the fly.
+        Uses the message 'mediaUrl' when Evolution stores media itself (S3/MinIO), the
+        getBase64FromMediaMessage endpoint otherwise. The caller must close the file.
+        :param message_object: The full message dict from the webhook
+        :return: a file object positioned at 0, or None
+        :raise MediaTooLarge: if the media exceeds the configured media limit
+        """
+        config = self._get_config()
+        if not config:
+            return None
+        return _download_media(config, self._get_session(config), message_object)
+
+    @api.model
+    def get_media_files(self, message_objects):
+        """
+        Download the media of several webhook messages concurrently.
+        The worker threads only do HTTP, with the immutable config and the pooled
+        session; at most MEDIA_HOST_CONCURRENCY downloads run against a same host.
+        Media over the size limit are skipped. The caller must close the files.
+        :param message_objects: list of full message dicts from the webhook
+        :return: list of file objects (or None), in the order of `message_objects`
+        """
+        config = self._get_config()
+        if not config or not message_objects:
+            return [None] * len(message_objects)
+        session = self._get_session(config)
+
+        # Semaphores are all created upfront, the threads only read the dict
+        host_limits = {}
+        hosts = []
+        for message_object in message_objects:
+            host = urlsplit(_media_source(config, message_object)).netloc
+            host_limits.setdefault(host, threading.BoundedSemaphore(MEDIA_HOST_CONCURRENCY))
+            hosts.append(host)
+
+        def fetch(message_object, host):
+            with host_limits[host]:
+                try:
+                    return _download_media(config, session, message_object)
+                except MediaTooLarge as e:
+                    _logger.warning("Media of message %s skipped: %s", message_object.get('key', {}).get('id'), str(e))
+                    return None
+
+        if len(message_objects) == 1:
+            return [fetch(message_objects[0], hosts[0])]
+
+        max_workers = min(len(message_objects), config.pool_size, MEDIA_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='whatsapp_media') as executor:
+            futures = [executor.submit(fetch, message_object, host) for message_object, host in zip(message_objects, hosts)]
+        results = []
+        error = None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                error = error or e
+                results.append(None)
+        if error:
+            for media_file in results:
+                if media_file:
+                    media_file.close()
+            raise error
+        return results
+
     @api.model
     def test_connection(self):
         """
         Test connection to Evolution API instance.
         """
-        base_url, token, instance = self._get_api_config()
-        if not base_url or not token:
+        config = self._get_config()
+        if not config:
             return {'success': False, 'message': 'Missing URL or Token in settings.'}
 
-        headers = {
-            'Content-Type': 'application/json',
-            'apikey': token
-        }
-        
         # Endpoint to check connection state of the specific instance
-        endpoint = f"{base_url}/instance/connectionState/{instance}"
+        endpoint = config.endpoints['connection_state']
+        instance = config.instance
+        session = self._get_session(config)
         
         try:
-            response = requests.get(endpoint, headers=headers, timeout=5)
+            # Manual probe: goes through even when the circuit is open, and closes it if the server answers
+            response = session.session.get(endpoint, endpoint='connection_state', headers=config.headers)
+            if response.status_code < 500:
+                session.breaker.record_success()
             if response.status_code == 200:
                 data = response.json()
                 # Evolution v2 usually returns { "instance": { "state": "open" } } or just state object
                 state = data.get('instance', {}).get('state') or data.get('state') or 'unknown'
-                return {'success': True, 'message': f'Connection Successful! Instance State: {state}'}
+                result = {'success': True, 'message': f'Connection Successful! Instance State: {state}'}
             elif response.status_code == 404:
-                return {'success': False, 'message': f'Instance "{instance}" not found (404).'}
+                result = {'success': False, 'message': f'Instance "{instance}" not found (404).'}
             elif response.status_code == 401:
-                return {'success': False, 'message': 'Authentication failed (401). Check API Token.'}
+                result = {'success': False, 'message': 'Authentication failed (401). Check API Token.'}
             else:
-                return {'success': False, 'message': f'Error {response.status_code}: {response.text}'}
+                result = {'success': False, 'message': f'Error {response.status_code}: {response.text}'}
         except requests.exceptions.RequestException as e:
-            return {'success': False, 'message': f'Connection Failed: {str(e)}'}
+            result = {'success': False, 'message': f'Connection Failed: {str(e)}'}
+
+        breaker = session.breaker.get_state(refresh=True)
+        result['breaker'] = breaker.state
+        result['message'] += f' Circuit breaker: {breaker.state}'
+        if breaker.state != 'closed':
+            result['message'] += f' ({breaker.failure_count} failures, last: {breaker.last_error})'
+        return result
 
     @api.model
     def fetch_all_groups(self):
         """
         Fetch all groups from the connected Evolution API instance.
-        Returns a list of dicts: [{'id': '...', 'subject': '...'}, ...]
+        Returns a list of dicts: [{'id': '...', 'subject': '...', 'picture_url': '...'}, ...]
         """
-        base_url, token, instance = self._get_api_config()
-        if not base_url or not token:
+        config = self._get_config()
+        if not config:
             return []
 
-        headers = {
-            'Content-Type': 'application/json',
-            'apikey': token
-        }
-        
-        endpoint = f"{base_url}/group/fetchAllGroups/{instance}?getParticipants=false"
+        endpoint = config.endpoints['fetch_all_groups']
         
         try:
-            response = requests.get(endpoint, headers=headers, timeout=15)
+            response = self._get_session(config).get(endpoint, endpoint='fetch_all_groups', headers=config.headers)
             if response.status_code == 200:
                 data = response.json()
                 # Evolution v2 returns usually a list of group objects, or { "groups": [...] }
@@ -246,7 +590,7 @@ class EvolutionApi(models.AbstractModel):
                     jid = g.get('id')
                     subject = g.get('subject') or g.get('name') or 'Unknown Group'
                     if jid:
-                        result.append({'id': jid, 'subject': subject})
+                        result.append({'id': jid, 'subject': subject, 'picture_url': g.get('pictureUrl') or ''})
                 return result
             else:
                 _logger.error("Failed to fetch groups: %d %s", response.status_code, response.text)
@@ -258,46 +602,54 @@ class EvolutionApi(models.AbstractModel):
     @api.model
     def fetch_profile_picture(self, jid):
         """
-        Fetch profile picture URL and download it as Base64.
+        Return the profile picture of a JID as Base64, through the avatar cache.
         Returns: base64 string or None
         """
-        base_url, token, instance = self._get_api_config()
-        if not base_url or not token:
+        return self.env['whatsapp.avatar.cache'].sudo()._get_avatar(jid)
+
+    @api.model
+    def fetch_profile_picture_url(self, jid):
+        """
+        Fetch the CDN URL of the profile picture of a JID.
+        Returns: the URL, '' if the JID has no picture, None on API error
+        """
+        config = self._get_config()
+        if not config:
             return None
 
-        headers = {
-            'Content-Type': 'application/json',
-            'apikey': token
-        }
-        
         # Endpoint to fetch URL
-        endpoint = f"{base_url}/chat/fetchProfilePictureUrl/{instance}"
+        endpoint = config.endpoints['fetch_profile_picture']
         payload = {"number": jid}
         
         try:
             _logger.info("Fetching profile picture for JID: %s", jid)
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=10)
+            response = self._get_session(config).post(endpoint, endpoint='fetch_profile_picture', headers=config.headers, json=payload)
             
             if response.status_code == 200:
                 data = response.json()
                 _logger.info("Profile Picture Response: %s", data)
                 # Evolution v2 structure: { "profilePictureUrl": "https://..." }
                 url = data.get('profilePictureUrl') or data.get('picture')
-                
-                if url:
-                    _logger.info("Downloading image from: %s", url)
-                    image_response = requests.get(url, timeout=10)
-                    if image_response.status_code == 200:
-                        import base64
-                        return base64.b64encode(image_response.content).decode('utf-8')
-                    else:
-                        _logger.error("Failed to download image from URL: %d", image_response.status_code)
-                else:
-                    _logger.warning("No 'profilePictureUrl' in response.")
-            else:
-                 _logger.error("Fetch Profile Picture API Error: %d %s", response.status_code, response.text)
+                if not url:
+                    _logger.info("No profile picture for %s", jid)
+                return url or ''
+            _logger.error("Fetch Profile Picture API Error: %d %s", response.status_code, response.text)
             return None
         except Exception as e:
             _logger.error("Error fetching profile picture for %s: %s", jid, str(e))
             return None
 
+    @api.model
+    def download_profile_picture(self, url, etag=None):
+        """
+        Download a profile picture from the WhatsApp CDN, conditionally if `etag` is given.
+        Returns: (content, etag), content is None if the picture was not modified
+        :raise requests.exceptions.RequestException: on download failure
+        """
+        headers = {'If-None-Match': etag} if etag else {}
+        _logger.info("Downloading image from: %s", url)
+        response = self._get_session().get(url, endpoint='download', headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        return response.content, response.headers.get('ETag')
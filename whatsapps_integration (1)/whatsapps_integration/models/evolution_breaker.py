@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker shared by all the workers of a database.
+
+When the Evolution server is down, calls fail fast with `EvolutionUnavailable`
+instead of waiting for the request timeout. The breaker state lives in the
+`whatsapp_circuit_breaker` table, so that every worker sees it; it is only
+updated on failures and state changes, through short-lived cursors of their
+own, and each worker reads it at most every READ_TTL seconds.
+
+    closed ──(threshold consecutive failures)──> open
+    open ──(reset delay elapsed, one caller probes)──> half_open
+    half_open ──(probe succeeds)──> closed, ──(probe fails)──> open
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import requests
+
+from odoo import fields
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 30
+READ_TTL = 2.0
+
+
+class EvolutionUnavailable(requests.exceptions.ConnectionError):
+    """The circuit is open, the Evolution API was not called."""
+
+
+class BreakerState(NamedTuple):
+    state: str
+    failure_count: int
+    changed_at: datetime
+    last_error: str
+
+
+CLOSED = BreakerState('closed', 0, None, None)
+
+
+class CircuitBreaker:
+
+    def __init__(self, dbname, key, threshold=DEFAULT_FAILURE_THRESHOLD, reset_seconds=DEFAULT_RESET_SECONDS,
+                 cursor_factory=None):
+        self.dbname = dbname
+        self.cursor_factory = cursor_factory
+        self.key = key
+        self.threshold = max(threshold, 1)
+        self.reset_seconds = max(reset_seconds, 1)
+        self._state = None
+        self._expiry = 0.0
+        self._lock = threading.Lock()
+
+    def _cursor(self):
+        # Own cursor: the breaker must be updated even if the caller's transaction
+        # rolls back, and must be usable from worker threads. Tests inject a
+        # factory working on their own transaction.
+        if self.cursor_factory:
+            return self.cursor_factory()
+        from odoo.modules.registry import Registry
+        return Registry(self.dbname).cursor()
+
+    def _store(self, row):
+        state = BreakerState(*row) if row else CLOSED
+        with self._lock:
+            self._state = state
+            self._expiry = time.monotonic() + READ_TTL
+        return state
+
+    def get_state(self, refresh=False):
+        with self._lock:
+            if not refresh and self._state is not None and time.monotonic() < self._expiry:
+                return self._state
+        with self._cursor() as cr:
+            cr.execute("""
+                SELECT state, failure_count, changed_at, last_error
+                  FROM whatsapp_circuit_breaker
+                 WHERE name = %s
+            """, [self.key])
+            return self._store(cr.fetchone())
+
+    def _reset_elapsed(self, state):
+        return state.changed_at and fields.Datetime.now() - state.changed_at >= timedelta(seconds=self.reset_seconds)
+
+    def is_open(self):
+        """Whether calls currently fail fast. Read-only, never claims the probe."""
+        state = self.get_state()
+        return state.state != 'closed' and not self._reset_elapsed(state)
+
+    def allow(self):
+        """Whether a call may go through. Past the reset delay, a single caller gets to probe."""
+        state = self.get_state()
+        if state.state == 'closed':
+            return True
+        if not self._reset_elapsed(state):
+            return False
+        with self._cursor() as cr:
+            # Only one worker wins the half-open probe, the others keep failing fast
+            cr.execute("""
+                UPDATE whatsapp_circuit_breaker
+                   SET state = 'half_open', changed_at = NOW() AT TIME ZONE 'UTC'
+                 WHERE name = %s
+                   AND state IN ('open', 'half_open')
+                   AND changed_at <= NOW() AT TIME ZONE 'UTC' - %s * INTERVAL '1 second'
+             RETURNING state, failure_count, changed_at, last_error
+            """, [self.key, self.reset_seconds])
+            row = cr.fetchone()
+        if row:
+            self._store(row)
+            _logger.info("Evolution circuit %s half-open, probing", self.key)
+            return True
+        self.get_state(refresh=True)
+        return False
+
+    def record_success(self):
+        state = self.get_state()
+        if state.state == 'closed' and not state.failure_count:
+            return
+        with self._cursor() as cr:
+            cr.execute("""
+                UPDATE whatsapp_circuit_breaker
+                   SET state = 'closed', failure_count = 0, changed_at = NOW() AT TIME ZONE 'UTC'
+                 WHERE name = %s
+             RETURNING state, failure_count, changed_at, last_error
+            """, [self.key])
+            self._store(cr.fetchone())
+        if state.state != 'closed':
+            _logger.info("Evolution circuit %s closed", self.key)
+
+    def record_failure(self, error):
+        with self._cursor() as cr:
+            cr.execute("""
+                INSERT INTO whatsapp_circuit_breaker AS b (name, state, failure_count, changed_at, last_error)
+                     VALUES (%(key)s, CASE WHEN %(threshold)s <= 1 THEN 'open' ELSE 'closed' END, 1,
+                             NOW() AT TIME ZONE 'UTC', %(error)s)
+                ON CONFLICT (name) DO UPDATE
+                        SET failure_count = b.failure_count + 1,
+                            last_error = EXCLUDED.last_error,
+                            state = CASE WHEN b.state = 'half_open' OR b.failure_count + 1 >= %(threshold)s
+                                         THEN 'open' ELSE b.state END,
+                            changed_at = CASE WHEN b.state = 'half_open'
+                                                OR (b.state = 'closed' AND b.failure_count + 1 >= %(threshold)s)
+                                              THEN NOW() AT TIME ZONE 'UTC' ELSE b.changed_at END
+                  RETURNING state, failure_count, changed_at, last_error
+            """, {'key': self.key, 'threshold': self.threshold, 'error': str(error)[:500]})
+            state = self._store(cr.fetchone())
+        if state.state == 'open':
+            _logger.warning("Evolution circuit %s open after %d failures: %s", self.key, state.failure_count, error)
+
+
+class GuardedSession:
+    """Pooled session whose calls to the Evolution server go through the circuit breaker.
+
+    Calls to other hosts (CDN downloads) are not guarded. Connection errors,
+    timeouts and 5xx answers count as failures, other answers as successes.
+    """
+
+    def __init__(self, session, breaker, base_url):
+        self.session = session
+        self.breaker = breaker
+        self.base_url = base_url
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        if not url.startswith(self.base_url):
+            return self.session.request(method, url, endpoint=endpoint, **kwargs)
+        if not self.breaker.allow():
+            state = self.breaker.get_state()
+            raise EvolutionUnavailable(f"Evolution API unavailable, circuit {state.state} ({state.last_error})")
+        try:
+            response = self.session.request(method, url, endpoint=endpoint, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            self.breaker.record_failure(e)
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure(f"{response.status_code} on {endpoint or url}")
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, url, endpoint=None, **kwargs):
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint=None, **kwargs):
+        return self.request('POST', url, endpoint=endpoint, **kwargs)
+
+    def stats(self):
+        return dict(self.session.stats(), breaker=self.breaker.get_state().state)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(dbname, key, threshold=DEFAULT_FAILURE_THRESHOLD, reset_seconds=DEFAULT_RESET_SECONDS):
+    """Return the breaker of (database, Evolution instance) of this worker."""
+    breaker = _breakers.get((dbname, key))
+    if breaker is None or (breaker.threshold, breaker.reset_seconds) != (max(threshold, 1), max(reset_seconds, 1)):
+        with _breakers_lock:
+            breaker = _breakers[(dbname, key)] = CircuitBreaker(dbname, key, threshold, reset_seconds)
+    return breaker
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming helpers for media exchanged with the Evolution API.
+
+Media never exists as a whole base64 string in memory: downloads are
+decoded chunk by chunk into a spooled temporary file, uploads are encoded
+chunk by chunk from the file while the request body is being sent.
+"""
+import base64
+import json
+import re
+import tempfile
+
+CHUNK_SIZE = 3 * 64 * 1024  # multiple of 3, so that encoded chunks never need padding
+SPOOL_MAX_SIZE = 1024 * 1024  # bytes kept in memory before a temporary file spills to disk
+DEFAULT_MEDIA_MAX_BYTES = 64 * 1024 * 1024
+
+_JSON_ESCAPE_RE = re.compile(rb'\\(.)')
+_JSON_ESCAPES = {b'/': b'/', b'n': b'', b'r': b'', b't': b''}
+
+
+class MediaTooLarge(Exception):
+    """The media exceeds the configured per-message ceiling."""
+
+
+def new_spooled_file():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+
+def copy_limited(chunks, out, max_bytes):
+    """Write byte chunks to `out`, raising `MediaTooLarge` past `max_bytes`. Returns the size."""
+    size = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        size += len(chunk)
+        if size > max_bytes:
+            raise MediaTooLarge(f"Media exceeds the limit of {max_bytes} bytes")
+        out.write(chunk)
+    return size
+
+
+class Base64StreamDecoder:
+    """Incremental base64 decoder writing to a file object, with a size ceiling."""
+
+    def __init__(self, out, max_bytes):
+        self.out = out
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._pending = b''
+        self._started = False
+
+    def feed(self, data):
+        if not self._started:
+            data = self._pending + data
+            self._pending = b''
+            if len(data) < 5 and b'data:'.startswith(data):
+                self._pending = data
+                return
+            # Strip an eventual data URI header ("data:image/png;base64,")
+            if data[:5] == b'data:':
+                if b',' not in data:
+                    self._pending = data
+                    return
+                data = data.split(b',', 1)[1]
+            self._started = True
+        data = self._pending + data.translate(None, b' \t\r\n')
+        cut = len(data) - len(data) % 4
+        self._pending = data[cut:]
+        if cut:
+            self._write(base64.b64decode(data[:cut]))
+
+    def close(self):
+        if self._pending:
+            self._write(base64.b64decode(self._pending + b'=' * (-len(self._pending) % 4)))
+            self._pending = b''
+        return self.size
+
+    def _write(self, decoded):
+        self.size += len(decoded)
+        if self.size > self.max_bytes:
+            raise MediaTooLarge(f"Media exceeds the limit of {self.max_bytes} bytes")
+        self.out.write(decoded)
+
+
+def iter_json_string_field(chunks, field):
+    """Yield the raw content of the string `field` of a streamed JSON document, piece by piece.
+
+    `field` may be a tuple of alternative names, the first of them found in
+    the document is read. Meant for large base64 values: only the bytes
+    around the key are buffered. Raises ValueError if the field is not found.
+    """
+    names = (field,) if isinstance(field, str) else tuple(field)
+    marker = re.compile(rb'"(?:' + b'|'.join(re.escape(name.encode()) for name in names) + rb')"\s*:\s*"')
+    keep = max(map(len, names)) + 32  # enough to catch a marker split over two chunks
+    chunks = iter(chunks)
+    buffer = b''
+    for chunk in chunks:
+        buffer += chunk
+        match = marker.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        buffer = buffer[-keep:]
+    else:
+        raise ValueError(f"Field {field!r} not found in response")
+
+    pending_escape = b''
+    while True:
+        data = pending_escape + buffer
+        pending_escape = b''
+        # Find the closing quote, skipping escaped characters
+        end = -1
+        i = data.find(b'"')
+        while i != -1:
+            backslashes = len(data[:i]) - len(data[:i].rstrip(b'\\'))
+            if backslashes % 2 == 0:
+                end = i
+                break
+            i = data.find(b'"', i + 1)
+        piece = data if end == -1 else data[:end]
+        if end == -1 and piece.endswith(b'\\') and (len(piece) - len(piece.rstrip(b'\\'))) % 2:
+            piece, pending_escape = piece[:-1], b'\\'
+        if piece:
+            yield _JSON_ESCAPE_RE.sub(lambda m: _JSON_ESCAPES.get(m.group(1), m.group(1)), piece)
+        if end != -1:
+            return
+        buffer = next(chunks, None)
+        if buffer is None:
+            raise ValueError(f"Unterminated value for field {field!r}")
+
+
+class Base64JsonBody:
+    """Re-iterable JSON request body whose `media_key` value is the base64 of a file.
+
+    `open_file` is called at each iteration, so the body can be replayed when
+    the session retries the request. The length is known upfront, the
+    request is sent with a Content-Length rather than chunked.
+    """
+
+    def __init__(self, fields, open_file, file_size, media_key='media', chunk_size=CHUNK_SIZE):
+        assert chunk_size % 3 == 0, "chunk_size must be a multiple of 3"
+        head = json.dumps(fields)[:-1]
+        self.prefix = (head + (', ' if fields else '') + json.dumps(media_key) + ': "').encode()
+        self.suffix = b'"}'
+        self.open_file = open_file
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.prefix) + 4 * ((self.file_size + 2) // 3) + len(self.suffix)
+
+    def __iter__(self):
+        yield self.prefix
+        with self.open_file() as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                yield base64.b64encode(chunk)
+        yield self.suffix
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Per-worker pooled HTTP session for the Evolution API.
+
+Every Odoo worker keeps a single ``requests.Session`` with a keep-alive
+connection pool, so consecutive calls to the Evolution server reuse the
+same TCP/TLS connection instead of paying a new handshake each time.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 8.0
+
+# Timeouts (connect, read) per logical endpoint, in seconds
+ENDPOINT_TIMEOUTS = {
+    'send_text': (5, 10),
+    'send_media': (5, 30),
+    'get_media_base64': (5, 30),
+    'connection_state': (3, 5),
+    'fetch_all_groups': (5, 15),
+    'fetch_profile_picture': (5, 10),
+    'download': (5, 10),
+}
+DEFAULT_TIMEOUT = (5, 15)
+
+# Status codes worth retrying. They are only retried for idempotent methods,
+# a POST to sendText that timed out server-side may already have been delivered.
+RETRY_STATUSES = frozenset({502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD'})
+
+
+def _not_sent(error):
+    """Tell whether a ConnectionError happened before the request was sent."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    # MaxRetryError wraps the underlying urllib3 error in `reason`
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+class EvolutionSession:
+    """Keep-alive session with retry, backoff and jitter."""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        # Retries are handled by `request` so that jitter and the idempotency
+        # rules above apply, the adapter itself never retries.
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.retries = 0
+
+    def _sleep_backoff(self, attempt):
+        # Exponential backoff with full jitter
+        delay = min(MAX_BACKOFF, self.backoff * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def request(self, method, url, endpoint=None, timeout=None, **kwargs):
+        """Perform an HTTP request through the pool.
+
+        :param endpoint: logical endpoint name, used to pick the timeout
+        :param timeout: explicit timeout, overrides the endpoint one
+        """
+        method = method.upper()
+        if timeout is None:
+            timeout = ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # Only a connection that could not be established guarantees
+                # the request was never sent. A connection aborted or reset
+                # afterwards may follow a delivered POST to sendText: retrying
+                # it could send the same WhatsApp message twice.
+                if attempt >= self.max_retries or not (idempotent or _not_sent(e)):
+                    raise
+                _logger.warning("Evolution %s %s failed (%s), retrying", method, endpoint or url, e)
+            else:
+                if not (idempotent and response.status_code in RETRY_STATUSES and attempt < self.max_retries):
+                    return response
+                _logger.warning("Evolution %s %s returned %s, retrying", method, endpoint or url, response.status_code)
+                response.close()
+            attempt += 1
+            self.retries += 1
+            self._sleep_backoff(attempt)
+
+    def get(self, url, endpoint=None, **kwargs):
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint=None, **kwargs):
+        return self.request('POST', url, endpoint=endpoint, **kwargs)
+
+    def stats(self):
+        """Pool counters: a hit is a request served on an already open connection."""
+        connections = requests_count = 0
+        pools = self.adapter.poolmanager.pools
+        # The pool container refuses plain iteration, go through its keys
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests_count += pool.num_requests
+        return {
+            'pool_size': self.pool_size,
+            'requests': requests_count,
+            'pool_hits': max(requests_count - connections, 0),
+            'pool_misses': connections,
+            'retries': self.retries,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(pool_size=DEFAULT_POOL_SIZE):
+    """Return the session of the current worker process.
+
+    Sessions are keyed by pid so that a worker forked from a process that
+    already opened connections never shares their sockets.
+    """
+    key = os.getpid()
+    session = _sessions.get(key)
+    if session is not None and session.pool_size == pool_size:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None or session.pool_size != pool_size:
+            if session is not None:
+                session.close()
+            session = _sessions[key] = EvolutionSession(pool_size=pool_size)
+    return session
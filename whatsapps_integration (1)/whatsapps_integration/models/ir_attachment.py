@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import shutil
+import uuid
+
+from odoo import models, api
+from odoo.tools.mimetypes import guess_mimetype
+
+CHUNK_SIZE = 64 * 1024
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    @api.model
+    def _whatsapp_create_from_file(self, fileobj, vals):
+        """Create an attachment from a file object, copying it chunk by chunk into the filestore.
+
+        Mirrors `_file_write` without ever holding the whole content in memory.
+        `create` ignores the file fields, the record is created empty and
+        bound to the file afterwards. With database storage the content has
+        to be loaded, it is then created the regular way.
+        """
+        fileobj.seek(0)
+        if self._storage() != 'file':
+            return self.create({**vals, 'raw': fileobj.read()})
+
+        sha = hashlib.sha1()
+        size = 0
+        head = b''
+        for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+            head = head or chunk
+            sha.update(chunk)
+            size += len(chunk)
+        checksum = sha.hexdigest()
+        fname = f'{checksum[:2]}/{checksum}'
+        full_path = self._full_path(fname)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            tmp_path = f'{full_path}.{uuid.uuid4().hex}.tmp'
+            fileobj.seek(0)
+            with open(tmp_path, 'wb') as out:
+                shutil.copyfileobj(fileobj, out, CHUNK_SIZE)
+            os.replace(tmp_path, full_path)
+        # Let the filestore GC remove the file if the transaction is rolled back
+        self._mark_for_gc(fname)
+        attachment = self.create({
+            **vals,
+            'type': 'binary',
+            'mimetype': vals.get('mimetype') or guess_mimetype(head),
+        })
+        attachment.flush_recordset()
+        self.env.cr.execute("""
+            UPDATE ir_attachment
+               SET store_fname = %s, checksum = %s, file_size = %s, mimetype = %s
+             WHERE id = %s
+        """, [fname, checksum, size, attachment.mimetype, attachment.id])
+        attachment.invalidate_recordset(['store_fname', 'checksum', 'file_size', 'mimetype', 'raw', 'datas'])
+        return attachment
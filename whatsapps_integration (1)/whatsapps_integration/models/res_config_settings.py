@@ -1,12 +1,41 @@
 # -*- coding: utf-8 -*-
 from odoo import fields, models
 
+from .evolution_api import CONFIG_PARAMS
+
 class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
 
     evolution_api_url = fields.Char(string='Evolution API URL', config_parameter='whatsapp.evolution_api_url', help="Base URL of your Evolution API instance")
     evolution_api_token = fields.Char(string='Global API Token', config_parameter='whatsapp.evolution_api_token', help="Global API Key for authentication")
     evolution_instance_name = fields.Char(string='Instance Name', config_parameter='whatsapp.evolution_instance_name', default='Odoo', help="Name of the instance to connect to")
+    evolution_pool_size = fields.Integer(string='Connection Pool Size', config_parameter='whatsapp.evolution_pool_size', default=10, help="Number of keep-alive connections each Odoo worker keeps open to the Evolution API")
+    evolution_media_max_mb = fields.Integer(string='Media Size Limit (MB)', config_parameter='whatsapp.evolution_media_max_mb', default=64, help="Largest media file exchanged with WhatsApp, bigger files are refused")
+    evolution_media_by_url = fields.Boolean(string='Send Media by URL', config_parameter='whatsapp.evolution_media_by_url', help="Let Evolution download outgoing attachments from a tokenized Odoo URL instead of uploading them. Requires Odoo to be reachable from the Evolution server.")
+    evolution_avatar_ttl_hours = fields.Integer(string='Profile Picture Cache (hours)', config_parameter='whatsapp.evolution_avatar_ttl_hours', default=24, help="How long a fetched WhatsApp profile picture, or the absence of one, is reused before asking WhatsApp again")
+    evolution_group_sync_hours = fields.Integer(string='Group Sync Interval (hours)', config_parameter='whatsapp.evolution_group_sync_hours', default=6, help="How often the WhatsApp groups are synchronized in the background, only changed groups are updated. 0 disables the automatic sync.")
+    evolution_breaker_threshold = fields.Integer(string='Failures Before Pausing', config_parameter='whatsapp.evolution_breaker_threshold', default=5, help="Consecutive Evolution API failures (timeouts, connection errors, 5xx) after which calls fail fast and the work is queued instead")
+    evolution_breaker_reset_seconds = fields.Integer(string='Pause Duration (seconds)', config_parameter='whatsapp.evolution_breaker_reset_seconds', default=30, help="Delay before a single call is let through to check whether the Evolution API is back")
+    evolution_webhook_mode = fields.Selection([
+        ('sync', 'Process immediately'),
+        ('deferred', 'Acknowledge first, process in background'),
+    ], string='Webhook Processing', config_parameter='whatsapp.evolution_webhook_mode', default='sync',
+        help="In background mode the webhook only stores the incoming event and answers right away, a scheduled action processes it.")
+
+    def set_values(self):
+        params = self.env['ir.config_parameter'].sudo()
+        previous = [params.get_param(key) for key in CONFIG_PARAMS]
+        super().set_values()
+        # Hot paths read the cached Evolution config, drop it when it changed
+        if previous != [params.get_param(key) for key in CONFIG_PARAMS]:
+            self.env['whatsapp.evolution.api']._clear_config_cache()
+        cron = self.env.ref('whatsapps_integration.ir_cron_whatsapp_group_sync', raise_if_not_found=False)
+        if cron:
+            vals = {'active': self.evolution_group_sync_hours > 0}
+            if self.evolution_group_sync_hours > 0:
+                vals.update(interval_number=self.evolution_group_sync_hours, interval_type='hours')
+            if any(cron[field] != value for field, value in vals.items()):
+                cron.sudo().write(vals)
 
     def action_test_connection(self):
         """Test the API connection and show notification."""
@@ -1,9 +1,124 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields
+from odoo import models, fields, api, tools
+from odoo.exceptions import MissingError
+
+from .utils import LRUCache, get_or_create, normalize_phone
+
+GROUP_GUEST_XMLID = 'whatsapps_integration.partner_whatsapp_group_guest'
+
+# (dbname, normalized number) -> partner id, only positive answers are cached
+_partner_id_by_number = LRUCache(maxsize=50000)
+
 
 class ResPartner(models.Model):
     _inherit = 'res.partner'
 
+    whatsapp_phone_key = fields.Char(
+        string="WhatsApp Phone Key", compute='_compute_whatsapp_number_keys', store=True, index=True,
+        help="Phone number reduced to its E.164 digits, used to match incoming WhatsApp messages")
+    whatsapp_mobile_key = fields.Char(
+        string="WhatsApp Mobile Key", compute='_compute_whatsapp_number_keys', store=True, index=True)
+
+    @api.depends(lambda self: ['phone', 'mobile'] if 'mobile' in self._fields else ['phone'])
+    def _compute_whatsapp_number_keys(self):
+        has_mobile = 'mobile' in self._fields
+        for partner in self:
+            partner.whatsapp_phone_key = normalize_phone(partner.phone)
+            partner.whatsapp_mobile_key = normalize_phone(partner.mobile) if has_mobile else False
+
+    @api.model
+    def _whatsapp_resolve_partner_id(self, number):
+        """Return the id of the partner whose phone or mobile is `number`, or False.
+
+        Answers from the per-worker LRU are checked against the partner's
+        keys, which the caller reads anyway, so a partner renumbered or
+        deleted in another worker is never returned.
+        """
+        key = normalize_phone(number)
+        if not key:
+            return False
+        cache_key = (self.env.cr.dbname, key)
+        partner_id = _partner_id_by_number.get(cache_key)
+        if partner_id:
+            partner = self.browse(partner_id)
+            try:
+                if partner.active and key in (partner.whatsapp_phone_key, partner.whatsapp_mobile_key):
+                    return partner_id
+            except MissingError:
+                pass
+            _partner_id_by_number.pop(cache_key)
+
+        partner = self.search(['|', ('whatsapp_phone_key', '=', key), ('whatsapp_mobile_key', '=', key)], limit=1)
+        if partner:
+            _partner_id_by_number.set(cache_key, partner.id)
+        return partner.id
+
+    @api.model
+    def _whatsapp_get_or_create_partner(self, number, make_vals):
+        """Return the partner of `number`, creating it from `make_vals()` if there is none.
+
+        Concurrent creations are serialized, see `get_or_create`.
+        """
+        key = normalize_phone(number)
+        return get_or_create(
+            self.env, f'whatsapp.partner:{key}',
+            lambda env: self.with_env(env).browse(self.with_env(env)._whatsapp_resolve_partner_id(key)),
+            lambda: self.create(make_vals()),
+        )
+
+    @api.model
+    @tools.ormcache()
+    def _whatsapp_group_guest_id(self):
+        """Id of the group guest data record, resolved once per worker.
+
+        Looked up by xmlid, so renaming the partner does not matter. Deleting
+        it removes its xmlid, which clears the registry caches.
+        """
+        return self.env['ir.model.data']._xmlid_to_res_id(GROUP_GUEST_XMLID, raise_if_not_found=False)
+
+    @api.model
+    def _whatsapp_get_group_guest(self):
+        """The shared partner authoring the messages of unknown group members."""
+        guest_id = self._whatsapp_group_guest_id()
+        if guest_id:
+            return self.browse(guest_id)
+        # The data record was deleted, recreate it under the same xmlid
+        return get_or_create(
+            self.env, 'whatsapp.group_guest',
+            lambda env: env.ref(GROUP_GUEST_XMLID, raise_if_not_found=False) or self.with_env(env),
+            self._whatsapp_create_group_guest,
+        )
+
+    @api.model
+    def _whatsapp_create_group_guest(self):
+        guest = self.create({'name': 'WhatsApp Group Guest', 'active': True})
+        module, name = GROUP_GUEST_XMLID.split('.')
+        self.env['ir.model.data'].create({
+            'module': module,
+            'name': name,
+            'model': self._name,
+            'res_id': guest.id,
+            'noupdate': True,
+        })
+        self.env.registry.clear_cache()
+        return guest
+
+    def _whatsapp_forget_numbers(self):
+        dbname = self.env.cr.dbname
+        for partner in self:
+            for key in (partner.whatsapp_phone_key, partner.whatsapp_mobile_key):
+                if key:
+                    _partner_id_by_number.pop((dbname, key))
+
+    def write(self, vals):
+        if {'phone', 'mobile', 'active'} & vals.keys():
+            self._whatsapp_forget_numbers()
+        return super().write(vals)
+
+    def unlink(self):
+        self._whatsapp_forget_numbers()
+        return super().unlink()
+
     def action_whatsapp_chat(self):
         """Open WhatsApp chat for this partner."""
         self.ensure_one()
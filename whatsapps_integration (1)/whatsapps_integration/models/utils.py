@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from odoo.exceptions import ConcurrencyError
+
+_MISSING = object()
+_NON_DIGITS_RE = re.compile(r'\D')
+
+
+def normalize_phone(number):
+    """Reduce a phone number or WhatsApp JID to its E.164 digits (no '+', no '00' prefix).
+
+    '+32 470 12-34-56', '0032470123456' and '32470123456@s.whatsapp.net' all
+    give '32470123456'. Returns False for empty input.
+    """
+    if not number:
+        return False
+    digits = _NON_DIGITS_RE.sub('', number.split('@', 1)[0])
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return digits or False
+
+
+def normalize_whatsapp_number(identifier):
+    """Canonical `discuss.channel.whatsapp_number`: group JIDs as-is, private chats as E.164 digits."""
+    if not identifier:
+        return False
+    identifier = identifier.strip()
+    if '@g.us' in identifier:
+        return identifier
+    return normalize_phone(identifier)
+
+
+def get_or_create(env, lock_key, find, create):
+    """Return the record found by `find(env)`, creating it with `create()` if there is none.
+
+    Webhooks of a same new contact run in parallel: the creation is serialized
+    on a transaction-level advisory lock on `lock_key`. When another
+    transaction holds it, or already committed the record after our snapshot
+    was taken, `ConcurrencyError` is raised once the lock is free, so that the
+    request is retried with a fresh snapshot that sees the record.
+    """
+    record = find(env)
+    if record:
+        return record
+    env.cr.execute("SELECT pg_try_advisory_xact_lock(hashtextextended(%s, 0))", [lock_key])
+    if not env.cr.fetchone()[0]:
+        # Wait for the other creator to commit, then start over
+        env.cr.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", [lock_key])
+        raise ConcurrencyError(f"{lock_key} was created concurrently")
+    # Our snapshot may predate a creation committed in the meantime
+    with env.registry.cursor() as cr:
+        if find(env(cr=cr)):
+            raise ConcurrencyError(f"{lock_key} was created concurrently")
+    return create()
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping, used for the per-worker caches of the webhook hot path."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available. Returns the time waited, in seconds."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
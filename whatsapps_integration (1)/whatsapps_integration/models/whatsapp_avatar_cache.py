@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import logging
+from datetime import timedelta
+
+import psycopg2
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+
+class WhatsAppAvatarCache(models.Model):
+    """Last known profile picture of a WhatsApp JID.
+
+    Fetching a picture costs two HTTP calls (URL lookup, then CDN download),
+    entries younger than the TTL answer without any call, JIDs without a
+    picture included. Older entries are revalidated: the image is only
+    downloaded again, and rewritten, when its content changed.
+    """
+    _name = 'whatsapp.avatar.cache'
+    _description = 'WhatsApp Profile Picture Cache'
+    _rec_name = 'jid'
+
+    jid = fields.Char(string="JID", required=True, index=True)
+    has_picture = fields.Boolean(string="Has Picture")
+    picture_url = fields.Char(string="Picture URL")
+    etag = fields.Char(string="ETag")
+    checksum = fields.Char(string="Checksum", help="SHA1 of the image")
+    image = fields.Binary(string="Image", attachment=True)
+    fetch_date = fields.Datetime(string="Fetched On", index=True)
+
+    _jid_unique = models.Constraint(
+        'unique(jid)',
+        'A WhatsApp JID can only be cached once.',
+    )
+
+    @api.model
+    def _get_avatar(self, jid):
+        """Return the base64 profile picture of `jid`, or None if it has none."""
+        api_service = self.env['whatsapp.evolution.api']
+        config = api_service._get_config()
+        if not config or not jid:
+            return None
+        entry = self.search([('jid', '=', jid)], limit=1)
+        now = fields.Datetime.now()
+        if entry.fetch_date and entry.fetch_date > now - timedelta(hours=config.avatar_ttl_hours):
+            return entry.image or None
+
+        url = api_service.fetch_profile_picture_url(jid)
+        if url is None:
+            # API error: keep serving the last known picture, retry next time
+            return entry.image or None
+
+        vals = {'fetch_date': now}
+        if not url:
+            vals.update(has_picture=False, picture_url=False, etag=False, checksum=False, image=False)
+        else:
+            try:
+                content, etag = api_service.download_profile_picture(url, etag=entry.etag if entry.image else None)
+            except Exception as e:
+                _logger.warning("Failed to download profile picture of %s: %s", jid, str(e))
+                return entry.image or None
+            vals.update(has_picture=True, picture_url=url, etag=etag or False)
+            # None means not modified, an identical content is not rewritten either
+            if content is not None:
+                checksum = hashlib.sha1(content).hexdigest()
+                if checksum != entry.checksum or not entry.image:
+                    vals.update(checksum=checksum, image=base64.b64encode(content))
+
+        if entry:
+            entry.write(vals)
+        else:
+            try:
+                # A concurrent request may cache the same JID, that is fine
+                with self.env.cr.savepoint():
+                    entry = self.create(dict(vals, jid=jid))
+            except psycopg2.IntegrityError:
+                return vals.get('image') or None
+        return entry.image or None
+
+    @api.autovacuum
+    def _gc_stale_avatars(self):
+        """Entries not refreshed for a month belong to contacts no longer seen."""
+        self.search([('fetch_date', '<', fields.Datetime.subtract(fields.Datetime.now(), days=30))]).unlink()
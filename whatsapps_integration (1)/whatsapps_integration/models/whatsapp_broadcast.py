@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+from .evolution_api import DEFAULT_SEND_DELAY, _send_text
+from .evolution_breaker import EvolutionUnavailable
+from .utils import TokenBucket, normalize_phone
+
+_logger = logging.getLogger(__name__)
+
+# Seconds a cron run keeps sending before handing over to a new run
+CRON_TIME_BUDGET = 50
+# Per-worker rate limiters keyed by (dbname, instance), so that a campaign
+# resumed by the next cron run keeps the pace of the previous one.
+_buckets = {}
+_buckets_lock = threading.Lock()
+# Outcome of a send refused by the open circuit breaker
+UNAVAILABLE = object()
+
+
+def _get_bucket(dbname, instance, rate_per_minute):
+    key = (dbname, instance)
+    rate = rate_per_minute / 60.0
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None or bucket.rate != rate:
+            bucket = _buckets[key] = TokenBucket(rate)
+        return bucket
+
+
+class WhatsAppBroadcast(models.Model):
+    """One message template sent to many contacts or leads.
+
+    Recipients are sent by the broadcast cron in batches: rendering and
+    bookkeeping happen on the cron cursor, the HTTP calls in worker threads
+    paced by a token bucket. Progress is committed after each batch, an
+    interrupted campaign resumes where it stopped.
+    """
+    _name = 'whatsapp.broadcast'
+    _description = 'WhatsApp Broadcast'
+    _order = 'id desc'
+
+    name = fields.Char(string="Name", required=True)
+    res_model = fields.Selection([
+        ('res.partner', 'Contacts'),
+        ('crm.lead', 'Leads / Opportunities'),
+    ], string="Recipients Model", required=True, default='res.partner')
+    body = fields.Text(string="Message", required=True, help="Rendered for each recipient, e.g. Hello {{ object.name }}")
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('paused', 'Paused'),
+        ('done', 'Done'),
+    ], string="Status", default='draft', required=True, index=True)
+    rate_per_minute = fields.Integer(string="Messages per Minute", default=30, help="Sending pace, keep it low enough for WhatsApp not to flag the number")
+    concurrency = fields.Integer(string="Parallel Sends", default=4)
+    send_delay = fields.Integer(string="Typing Delay (ms)", default=DEFAULT_SEND_DELAY)
+    recipient_ids = fields.One2many('whatsapp.broadcast.recipient', 'broadcast_id', string="Recipients")
+    recipient_count = fields.Integer(string="Recipients", compute='_compute_progress')
+    sent_count = fields.Integer(string="Sent", compute='_compute_progress')
+    failed_count = fields.Integer(string="Failed", compute='_compute_progress')
+    pending_count = fields.Integer(string="Pending", compute='_compute_progress')
+    progress = fields.Float(string="Progress", compute='_compute_progress')
+    estimated_end = fields.Datetime(string="Estimated End", compute='_compute_progress')
+    start_date = fields.Datetime(string="Started On", readonly=True)
+    end_date = fields.Datetime(string="Finished On", readonly=True)
+
+    @api.depends('recipient_ids.state', 'rate_per_minute', 'state')
+    def _compute_progress(self):
+        counts = defaultdict(dict)
+        for broadcast, state, count in self.env['whatsapp.broadcast.recipient']._read_group(
+                [('broadcast_id', 'in', self.ids)], ['broadcast_id', 'state'], ['__count']):
+            counts[broadcast.id][state] = count
+        now = fields.Datetime.now()
+        for broadcast in self:
+            by_state = counts[broadcast.id]
+            broadcast.recipient_count = sum(by_state.values())
+            broadcast.sent_count = by_state.get('sent', 0)
+            broadcast.failed_count = by_state.get('failed', 0)
+            broadcast.pending_count = by_state.get('pending', 0)
+            done = broadcast.sent_count + broadcast.failed_count
+            broadcast.progress = 100.0 * done / broadcast.recipient_count if broadcast.recipient_count else 0.0
+            broadcast.estimated_end = (
+                now + timedelta(minutes=broadcast.pending_count / broadcast.rate_per_minute)
+                if broadcast.state == 'running' and broadcast.rate_per_minute > 0 else False
+            )
+
+    @api.model
+    def _get_record_phone(self, record):
+        """WhatsApp number of a contact or lead, mobile first."""
+        numbers = [getattr(record, 'mobile', False), record.phone]
+        if record._name == 'crm.lead' and record.partner_id:
+            numbers += [getattr(record.partner_id, 'mobile', False), record.partner_id.phone]
+        return next((normalize_phone(number) for number in numbers if normalize_phone(number)), False)
+
+    @api.model
+    def _create_from_records(self, records, body, name=None, **vals):
+        """Create a running broadcast of `body` to `records`, one recipient per distinct number."""
+        if records._name not in dict(self._fields['res_model'].selection):
+            raise UserError(_("WhatsApp broadcasts can only be sent to contacts or leads."))
+        seen = set()
+        recipients = []
+        for record in records:
+            phone = self._get_record_phone(record)
+            if phone and phone not in seen:
+                seen.add(phone)
+                recipients.append({'res_id': record.id, 'phone': phone})
+        broadcast = self.create(dict(
+            vals,
+            name=name or _("Broadcast of %s", fields.Datetime.now()),
+            res_model=records._name,
+            body=body,
+            recipient_ids=[fields.Command.create(recipient) for recipient in recipients],
+        ))
+        broadcast.action_start()
+        return broadcast
+
+    def action_start(self):
+        self.filtered(lambda b: b.state in ('draft', 'paused')).write({'state': 'running'})
+        for broadcast in self.filtered(lambda b: not b.start_date):
+            broadcast.start_date = fields.Datetime.now()
+        self.env.ref('whatsapps_integration.ir_cron_whatsapp_broadcast')._trigger()
+        return True
+
+    def action_pause(self):
+        self.filtered(lambda b: b.state == 'running').write({'state': 'paused'})
+        return True
+
+    def action_retry_failed(self):
+        self.recipient_ids.filtered(lambda r: r.state == 'failed').write({'state': 'pending', 'error': False})
+        self.write({'state': 'running', 'end_date': False})
+        self.env.ref('whatsapps_integration.ir_cron_whatsapp_broadcast')._trigger()
+        return True
+
+    @api.model
+    def _cron_process(self, batch_size=100):
+        """Send the pending recipients of the running broadcasts within the time budget."""
+        deadline = time.monotonic() + CRON_TIME_BUDGET
+        breaker = self.env['whatsapp.evolution.api']._get_breaker()
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        for broadcast in self.search([('state', '=', 'running')], order='id'):
+            while time.monotonic() < deadline:
+                # Paused meanwhile? The state is read again after each commit
+                broadcast.invalidate_recordset(['state'])
+                if breaker and breaker.is_open():
+                    _logger.info("WhatsApp broadcasts postponed, the Evolution API circuit is open")
+                    return
+                if broadcast.state != 'running' or not broadcast._send_batch(batch_size):
+                    break
+                if auto_commit:
+                    self.env.cr.commit()
+            if broadcast.state == 'running' and not self.env['whatsapp.broadcast.recipient'].search_count([
+                    ('broadcast_id', '=', broadcast.id), ('state', '=', 'pending')], limit=1):
+                broadcast.write({'state': 'done', 'end_date': fields.Datetime.now()})
+                if auto_commit:
+                    self.env.cr.commit()
+            if time.monotonic() >= deadline:
+                self.env.ref('whatsapps_integration.ir_cron_whatsapp_broadcast')._trigger()
+                break
+
+    def _send_batch(self, batch_size):
+        """Send up to `batch_size` pending recipients. Returns the number of recipients processed."""
+        self.ensure_one()
+        recipients = self.env['whatsapp.broadcast.recipient'].search([
+            ('broadcast_id', '=', self.id), ('state', '=', 'pending'),
+        ], limit=batch_size)
+        if not recipients:
+            return 0
+        api_service = self.env['whatsapp.evolution.api']
+        config = api_service._get_config()
+        if not config:
+            raise UserError(_("Evolution API is not configured. Please check settings."))
+
+        existing = set(self.env[self.res_model].browse(recipients.mapped('res_id')).exists().ids)
+        gone = recipients.filtered(lambda r: r.res_id not in existing)
+        gone.write({'state': 'failed', 'error': _("The recipient record no longer exists.")})
+        recipients -= gone
+        bodies = self.env['mail.render.mixin']._render_template(
+            self.body, self.res_model, list(existing), engine='inline_template')
+
+        session = api_service._get_session(config)
+        bucket = _get_bucket(self.env.cr.dbname, config.instance, max(self.rate_per_minute, 1))
+        delay = self.send_delay
+
+        def send(phone, text):
+            # HTTP only, the results are written back on the cron cursor
+            bucket.acquire()
+            try:
+                result = _send_text(config, session, phone, text, delay=delay)
+            except EvolutionUnavailable:
+                return UNAVAILABLE
+            except Exception as e:
+                return str(e)
+            return result.get('error') if isinstance(result, dict) else None
+
+        jobs = [(recipient.phone, bodies[recipient.res_id]) for recipient in recipients]
+        with ThreadPoolExecutor(max_workers=max(min(self.concurrency, config.pool_size), 1),
+                                thread_name_prefix='whatsapp_broadcast') as executor:
+            errors = list(executor.map(lambda job: send(*job), jobs))
+
+        now = fields.Datetime.now()
+        sent = self.env['whatsapp.broadcast.recipient']
+        failed = defaultdict(lambda: self.env['whatsapp.broadcast.recipient'])
+        for recipient, error in zip(recipients, errors):
+            if error is UNAVAILABLE:
+                # Circuit open: left pending for the next run
+                continue
+            if error:
+                failed[error] |= recipient
+            else:
+                sent |= recipient
+        sent.write({'state': 'sent', 'sent_date': now})
+        for error, failed_recipients in failed.items():
+            failed_recipients.write({'state': 'failed', 'error': error})
+        failed_count = sum(len(failed_recipients) for failed_recipients in failed.values()) + len(gone)
+        _logger.info("WhatsApp broadcast %s: %d sent, %d failed", self.id, len(sent), failed_count)
+        return len(sent) + failed_count
+
+
+class WhatsAppBroadcastRecipient(models.Model):
+    _name = 'whatsapp.broadcast.recipient'
+    _description = 'WhatsApp Broadcast Recipient'
+    _order = 'id'
+    _log_access = False
+
+    broadcast_id = fields.Many2one('whatsapp.broadcast', string="Broadcast", required=True, ondelete='cascade', index=True)
+    res_id = fields.Integer(string="Record ID", required=True)
+    phone = fields.Char(string="Number", required=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ], string="Status", default='pending', required=True)
+    error = fields.Text(string="Error")
+    sent_date = fields.Datetime(string="Sent On")
+
+    def init(self):
+        # The cron always looks for the pending recipients of a broadcast
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_broadcast_recipient_pending_idx
+                ON whatsapp_broadcast_recipient (broadcast_id, id)
+             WHERE state = 'pending'
+        """)
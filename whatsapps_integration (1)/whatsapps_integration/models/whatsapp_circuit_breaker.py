@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+
+class WhatsAppCircuitBreaker(models.Model):
+    """Shared state of the Evolution API circuit breaker, see `evolution_breaker`.
+
+    Rows are written with plain SQL on dedicated cursors, the model only
+    declares the table and makes it readable.
+    """
+    _name = 'whatsapp.circuit.breaker'
+    _description = 'WhatsApp Circuit Breaker'
+    _log_access = False
+
+    name = fields.Char(string="Evolution Instance", required=True)
+    state = fields.Selection([
+        ('closed', 'Closed'),
+        ('open', 'Open'),
+        ('half_open', 'Half-Open'),
+    ], string="Status", default='closed', required=True)
+    failure_count = fields.Integer(string="Consecutive Failures")
+    changed_at = fields.Datetime(string="Changed On")
+    last_error = fields.Char(string="Last Error")
+
+    # Backs the ON CONFLICT (name) upsert of the breaker
+    _name_unique = models.Constraint(
+        'unique(name)',
+        'An Evolution instance has a single circuit breaker.',
+    )
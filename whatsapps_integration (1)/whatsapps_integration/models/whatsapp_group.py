@@ -1,5 +1,22 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+
 from odoo import models, fields, api
+from odoo.exceptions import ConcurrencyError
+
+from .utils import LRUCache, get_or_create
+
+_logger = logging.getLogger(__name__)
+
+# (dbname, jid) -> (status, expiry), other workers pick up changes within the TTL
+_group_status_by_jid = LRUCache(maxsize=5000)
+GROUP_STATUS_TTL = 60.0
 
 class WhatsAppGroup(models.Model):
     _name = 'whatsapp.group'
@@ -10,6 +27,8 @@ class WhatsAppGroup(models.Model):
     whatsapp_id = fields.Char(string="Group JID", required=True, help="The WhatsApp Group ID (e.g. 12345@g.us)")
     active_channel_id = fields.Many2one('discuss.channel', string="Linked Channel", readonly=True)
     image_128 = fields.Image("Logo", max_width=128, max_height=128)
+    avatar_pending = fields.Boolean(string="Icon Fetch Pending", index=True, copy=False)
+    sync_hash = fields.Char(string="Sync Hash", copy=False, help="Hash of the subject and picture at the last group sync")
     
     status = fields.Selection([
         ('pending', 'Pending Approval'),
@@ -17,57 +36,227 @@ class WhatsAppGroup(models.Model):
         ('rejected', 'Rejected')
     ], string="Status", default='pending', tracking=True, required=True)
 
-    _sql_constraints = [
-        ('whatsapp_id_unique', 'unique(whatsapp_id)', 'This WhatsApp Group already exists in the system.')
-    ]
+    # Existing duplicates are merged by the 19.0.1.1.0 migration
+    _whatsapp_id_unique = models.Constraint(
+        'unique(whatsapp_id)',
+        'This WhatsApp Group already exists in the system.',
+    )
+
+    @api.model
+    def _whatsapp_group_status(self, jid):
+        """Approval status of the group `jid`, None if unknown, cached per worker.
+
+        Every group message of the webhook goes through this. The worker that
+        creates, deletes or changes the status or JID of a group drops its
+        entry, the other workers refresh theirs after GROUP_STATUS_TTL.
+        """
+        cache_key = (self.env.cr.dbname, jid)
+        cached = _group_status_by_jid.get(cache_key)
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
+        self.flush_model(['whatsapp_id', 'status'])
+        self.env.cr.execute("SELECT status FROM whatsapp_group WHERE whatsapp_id = %s", [jid])
+        row = self.env.cr.fetchone()
+        status = row[0] if row else None
+        _group_status_by_jid.set(cache_key, (status, time.monotonic() + GROUP_STATUS_TTL))
+        return status
+
+    def _whatsapp_forget_statuses(self, jids):
+        dbname = self.env.cr.dbname
+        for jid in jids:
+            if jid:
+                _group_status_by_jid.pop((dbname, jid))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        groups = super().create(vals_list)
+        self._whatsapp_forget_statuses(groups.mapped('whatsapp_id'))
+        return groups
+
+    def write(self, vals):
+        changed = any(
+            group[fname] != vals[fname]
+            for fname in ('whatsapp_id', 'status') if fname in vals
+            for group in self
+        )
+        jids = self.mapped('whatsapp_id') if changed else []
+        res = super().write(vals)
+        if changed:
+            self._whatsapp_forget_statuses([*jids, vals.get('whatsapp_id')])
+        return res
+
+    def unlink(self):
+        jids = self.mapped('whatsapp_id')
+        res = super().unlink()
+        self._whatsapp_forget_statuses(jids)
+        return res
+
+    @api.model
+    def _whatsapp_get_or_create_group(self, jid, make_vals):
+        """Return the group of `jid`, creating it from `make_vals()` if there is none.
+
+        Concurrent creations are serialized, see `get_or_create`.
+        """
+        def create():
+            try:
+                with self.env.cr.savepoint():
+                    return self.create(dict(make_vals(), whatsapp_id=jid))
+            except psycopg2.errors.UniqueViolation:
+                # Created without the lock (e.g. from the form view), retry to pick it up
+                raise ConcurrencyError(f"WhatsApp group {jid} was created concurrently")
+
+        return get_or_create(
+            self.env, f'whatsapp.group:{jid}',
+            lambda env: self.with_env(env).search([('whatsapp_id', '=', jid)], limit=1),
+            create,
+        )
 
     @api.model
     def action_fetch_groups(self):
         """Fetch groups from API and create pending records for new ones."""
-        groups = self.env['whatsapp.evolution.api'].fetch_all_groups()
-        created_count = 0
-        
-        for g in groups:
-            jid = g.get('id')
-            subject = g.get('subject')
-            
-            # Check if exists
-            existing = self.search([('whatsapp_id', '=', jid)], limit=1)
-            target_record = False
-            
-            if not existing:
-                target_record = self.create({
-                    'name': subject,
-                    'whatsapp_id': jid,
-                    'status': 'pending'
-                })
-                created_count += 1
-            else:
-                target_record = existing
-                # Update name if it is generic or different
-                if existing.name != subject and subject != 'Unknown Group':
-                     existing.write({'name': subject})
-            
-            # Auto-fetch image if missing
-            if target_record and not target_record.image_128:
-                try:
-                    pic = self.env['whatsapp.evolution.api'].fetch_profile_picture(jid)
-                    if pic:
-                        target_record.image_128 = pic
-                except Exception:
-                    pass
-                
+        stats = self._sync_groups()
+        timings = ', '.join(f"{phase} {duration * 1000:.0f}ms" for phase, duration in stats['timings'].items())
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': 'Group Sync',
-                'message': f'Sync Complete. Found {len(groups)} groups. Created {created_count} new pending groups.',
+                'message': f"Sync Complete. Found {stats['fetched']} groups. Created {stats['created']} new pending groups, "
+                           f"renamed {stats['renamed']}, skipped {stats['skipped']} unchanged. ({timings})",
                 'type': 'success',
                 'sticky': False,
             }
         }
 
+    @api.model
+    def _group_sync_hash(self, instance, group):
+        """Hash of what the sync mirrors of a group: its subject and picture, per instance."""
+        # The query string of CDN URLs only holds a signature and an expiry
+        picture = (group.get('picture_url') or '').split('?', 1)[0]
+        return hashlib.sha1(f"{instance}\0{group.get('subject') or ''}\0{picture}".encode()).hexdigest()
+
+    @api.model
+    def _sync_groups(self, incremental=False):
+        """Set-based sync of the groups of the Evolution instance.
+
+        Existing groups are read in one query, the new groups and the renames
+        are computed as a diff. New groups are created under the lock of
+        `_whatsapp_get_or_create_group`, as the webhook may create them at the
+        same time, the renames are applied with batched writes. Group
+        icons are not downloaded here, the avatar cron fetches them afterwards.
+
+        In incremental mode, groups whose sync hash did not change since the
+        last sync are skipped with a plain SQL read, before reaching the ORM.
+        Returns counters and the duration of each phase, in seconds.
+        """
+        api_service = self.env['whatsapp.evolution.api']
+        timings = {}
+        start = time.perf_counter()
+        groups = api_service.fetch_all_groups()
+        timings['fetch'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        config = api_service._get_config()
+        instance = config.instance if config else ''
+        remote = {g['id']: g for g in groups if g.get('id')}
+        hashes = {jid: self._group_sync_hash(instance, g) for jid, g in remote.items()}
+        skipped = 0
+        if incremental and hashes:
+            self.env.cr.execute("""
+                SELECT whatsapp_id, sync_hash
+                  FROM whatsapp_group
+                 WHERE whatsapp_id = ANY(%s)
+            """, [list(hashes)])
+            known = dict(self.env.cr.fetchall())
+            unchanged = {jid for jid, sync_hash in hashes.items() if known.get(jid) == sync_hash}
+            skipped = len(unchanged)
+            remote = {jid: g for jid, g in remote.items() if jid not in unchanged}
+
+        existing = {
+            group['whatsapp_id']: group
+            for group in self.search_read([('whatsapp_id', 'in', list(remote))], ['whatsapp_id', 'name', 'sync_hash'])
+        }
+        to_create = [
+            {'name': g.get('subject'), 'whatsapp_id': jid, 'status': 'pending', 'avatar_pending': True, 'sync_hash': hashes[jid]}
+            for jid, g in remote.items() if jid not in existing
+        ]
+        to_write = {}
+        renamed = 0
+        for jid, group in existing.items():
+            vals = {}
+            subject = remote[jid].get('subject')
+            # Update name if it is generic or different
+            if group['name'] != subject and subject != 'Unknown Group':
+                vals['name'] = subject
+                renamed += 1
+            if group['sync_hash'] != hashes[jid]:
+                vals['sync_hash'] = hashes[jid]
+                if group['sync_hash']:
+                    # Subject or picture changed, refresh the icon too
+                    vals['avatar_pending'] = True
+            if vals:
+                to_write[group['id']] = vals
+        timings['diff'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        created = self.browse()
+        for vals in to_create:
+            created |= self._whatsapp_get_or_create_group(vals['whatsapp_id'], lambda vals=vals: vals)
+        # Same values are written at once, in practice the renames of generic names
+        by_vals = defaultdict(list)
+        for group_id, vals in to_write.items():
+            by_vals[tuple(sorted(vals.items()))].append(group_id)
+        for vals, ids in by_vals.items():
+            self.browse(ids).write(dict(vals))
+        timings['write'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        refreshed = self.browse([group_id for group_id, vals in to_write.items() if vals.get('avatar_pending')])
+        if refreshed:
+            # The cached pictures of these groups may be outdated
+            self.env['whatsapp.avatar.cache'].sudo().search([
+                ('jid', 'in', refreshed.mapped('whatsapp_id')),
+            ]).write({'fetch_date': False})
+        # Groups already known but still without an icon are fetched too
+        missing_image = self.search([
+            ('id', 'in', [group['id'] for group in existing.values()]),
+            ('image_128', '=', False),
+            ('avatar_pending', '=', False),
+        ])
+        missing_image.avatar_pending = True
+        if created or refreshed or missing_image:
+            self.env.ref('whatsapps_integration.ir_cron_whatsapp_group_avatars')._trigger()
+        timings['queue'] = time.perf_counter() - start
+
+        stats = {
+            'fetched': len(groups),
+            'skipped': skipped,
+            'created': len(created),
+            'renamed': renamed,
+            'avatars_queued': len(created) + len(refreshed) + len(missing_image),
+            'timings': timings,
+        }
+        _logger.info("WhatsApp group sync: %s", stats)
+        return stats
+
+    @api.model
+    def _cron_sync_groups(self):
+        """Scheduled incremental sync, its cadence is set in the WhatsApp settings."""
+        return self._sync_groups(incremental=True)
+
+    @api.model
+    def _cron_fetch_avatars(self, batch_size=50):
+        """Fetch the icons of the groups queued by the sync."""
+        groups = self.search([('avatar_pending', '=', True)], limit=batch_size)
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        for group in groups:
+            group.action_fetch_image()
+            group.avatar_pending = False
+            if auto_commit:
+                self.env.cr.commit()
+        if len(groups) == batch_size:
+            self.env.ref('whatsapps_integration.ir_cron_whatsapp_group_avatars')._trigger()
+
     def action_fetch_image(self):
         """Fetch the group profile picture from WhatsApp."""
         for record in self:
@@ -94,7 +283,7 @@ class WhatsAppGroup(models.Model):
         # Optionally create the channel immediately if it doesn't exist
         if not self.active_channel_id:
             Channel = self.env['discuss.channel']
-            existing = Channel.search([('channel_type', '=', 'whatsapp'), ('whatsapp_number', '=', self.whatsapp_id)], limit=1)
+            existing = Channel.browse(Channel._whatsapp_resolve_channel_id(self.whatsapp_id))
             if existing:
                 self.active_channel_id = existing
                 # Update existing channel image too if missing
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import threading
+from contextlib import ExitStack
+
+from odoo import models, fields, api
+from odoo.exceptions import ConcurrencyError
+
+from .evolution_breaker import EvolutionUnavailable
+
+_logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+MEDIA_TYPE_MAP = {
+    'imageMessage': 'image',
+    'videoMessage': 'video',
+    'documentMessage': 'document',
+    'audioMessage': 'audio',
+    'stickerMessage': 'image'
+}
+
+
+class WhatsAppInboundEvent(models.Model):
+    """Raw Evolution webhook event staged for deferred processing.
+
+    In deferred mode the webhook only stores the request body here and
+    answers immediately, the processing cron then drains the table in
+    batches (partner resolution, media download, posting).
+    """
+    _name = 'whatsapp.inbound.event'
+    _description = 'WhatsApp Inbound Event'
+    _order = 'id'
+
+    event_type = fields.Char(string="Event Type")
+    remote_jid = fields.Char(string="Remote JID")
+    payload = fields.Text(string="Payload", required=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Processed'),
+        ('error', 'Error'),
+    ], string="Status", default='pending', required=True, index=True)
+    attempt_count = fields.Integer(string="Attempts", default=0)
+    result = fields.Char(string="Result")
+    error = fields.Text(string="Error")
+    processed_date = fields.Datetime(string="Processed On")
+
+    @api.model
+    def _ingest(self, raw_body, event_type=None, remote_jid=None):
+        """Stage a raw webhook body and wake up the processing cron after commit."""
+        event = self.create({
+            'payload': raw_body.decode('utf-8') if isinstance(raw_body, bytes) else raw_body,
+            'event_type': event_type,
+            'remote_jid': remote_jid,
+        })
+        self.env.ref('whatsapps_integration.ir_cron_whatsapp_inbound_process')._trigger()
+        return event
+
+    @api.model
+    def _get_queue_metrics(self):
+        """Queue depth and lag (age in seconds of the oldest pending event)."""
+        self.env.cr.execute("""
+            SELECT COUNT(*), EXTRACT(EPOCH FROM (NOW() AT TIME ZONE 'UTC' - MIN(create_date)))
+              FROM whatsapp_inbound_event
+             WHERE state = 'pending'
+        """)
+        depth, lag = self.env.cr.fetchone()
+        return {'depth': depth, 'lag_seconds': round(lag or 0.0, 3)}
+
+    @api.model
+    def _cron_process_events(self, batch_size=50):
+        """Process the pending events, oldest first, in batches."""
+        breaker = self.env['whatsapp.evolution.api']._get_breaker()
+        if breaker and breaker.is_open():
+            _logger.info("WhatsApp inbound processing postponed, the Evolution API circuit is open")
+            return self._get_queue_metrics()
+        events = self.search([('state', '=', 'pending')], limit=batch_size)
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        unavailable = False
+        for event in events:
+            try:
+                with self.env.cr.savepoint():
+                    result = self._process_payload(json.loads(event.payload))
+                event.write({
+                    'state': 'done',
+                    'result': result.get('reason') or result.get('status'),
+                    'processed_date': fields.Datetime.now(),
+                    'error': False,
+                })
+            except EvolutionUnavailable:
+                # Media could not be downloaded, keep the event for the next run
+                unavailable = True
+                break
+            except ConcurrencyError:
+                # A parallel run created its partner or channel, retry after commit
+                _logger.info("WhatsApp event %s postponed, its partner or channel is being created concurrently", event.id)
+                if auto_commit:
+                    self.env.cr.commit()
+                self.env.ref('whatsapps_integration.ir_cron_whatsapp_inbound_process')._trigger()
+                break
+            except Exception as e:
+                attempt_count = event.attempt_count + 1
+                _logger.exception("Failed to process WhatsApp event %s (attempt %d)", event.id, attempt_count)
+                event.write({
+                    'state': 'error' if attempt_count >= MAX_ATTEMPTS else 'pending',
+                    'attempt_count': attempt_count,
+                    'error': str(e),
+                })
+            if auto_commit:
+                self.env.cr.commit()
+
+        metrics = self._get_queue_metrics()
+        _logger.info("WhatsApp inbound events: processed %d, queue depth %d, lag %.1fs",
+                     len(events), metrics['depth'], metrics['lag_seconds'])
+        if len(events) == batch_size and not unavailable:
+            self.env.ref('whatsapps_integration.ir_cron_whatsapp_inbound_process')._trigger()
+        return metrics
+
+    @api.autovacuum
+    def _gc_processed_events(self):
+        """Processed events are only kept for a week."""
+        self.search([
+            ('state', '=', 'done'),
+            ('processed_date', '<', fields.Datetime.subtract(fields.Datetime.now(), days=7)),
+        ]).unlink()
+
+    @api.model
+    def _process_payload(self, data):
+        """Process a `messages.upsert` webhook payload and return the outcome as a dict.
+
+        The payload holds one message or a list of them (album sends arrive as
+        bursts of image messages). The media of all messages are downloaded
+        concurrently first, then the messages are posted on this cursor, in
+        their original order.
+        """
+        payload_data = data.get('data') or {}
+        batch = isinstance(payload_data, list)
+        with ExitStack() as cleanup:
+            messages = [self._parse_upsert(message_data) for message_data in (payload_data if batch else [payload_data])]
+            self._prefetch_media(messages, cleanup)
+            results = [message.get('result') or self._post_upsert(message) for message in messages]
+        if not batch:
+            return results[0]
+        return {'status': 'success', 'results': results}
+
+    @api.model
+    def _parse_upsert(self, payload_data):
+        """Extract what is needed to post a webhook message, without any I/O.
+
+        Returns a dict holding either the final `result` of an ignored message,
+        or its sender, text and eventual media description.
+        """
+        key = payload_data.get('key', {})
+        message_data = payload_data.get('message', {})
+        
+        # Ignore fromMe
+        if key.get('fromMe'):
+            return {'result': {'status': 'ignored', 'reason': 'from_me'}}
+            
+        remote_jid = key.get('remoteJid') 
+        if not remote_jid:
+            return {'result': {'status': 'error', 'reason': 'no_jid'}}
+            
+        is_group = '@g.us' in remote_jid
+        group_status = None
+        if is_group:
+            # Messages of rejected or pending groups are dropped from the
+            # cached status, before any lookup or download
+            group_status = self.env['whatsapp.group']._whatsapp_group_status(remote_jid)
+            if group_status in ('pending', 'rejected'):
+                _logger.info("Group %s is %s. Ignoring message.", remote_jid, group_status)
+                return {'result': {'status': 'ignored', 'reason': 'group_not_accepted'}}
+        _logger.info("Processing message from: %s (Group: %s)", remote_jid, is_group)
+        
+        # Extract content
+        text_body = ""
+        found_media_type = next((mt for mt in MEDIA_TYPE_MAP if mt in message_data), None)
+        
+        if found_media_type:
+            _logger.info("Found Media Type: %s", found_media_type)
+            text_body = message_data[found_media_type].get('caption', '')
+        elif 'conversation' in message_data:
+            text_body = message_data['conversation']
+        elif 'extendedTextMessage' in message_data:
+            text_body = message_data['extendedTextMessage'].get('text', '')
+
+        return {
+            'payload': payload_data,
+            'key': key,
+            'remote_jid': remote_jid,
+            'is_group': is_group,
+            'group_status': group_status,
+            'text_body': text_body,
+            'media_type': found_media_type,
+            'media_file': None,
+        }
+
+    @api.model
+    def _prefetch_media(self, messages, cleanup):
+        """Download the media of the parsed `messages` concurrently, closed through `cleanup`."""
+        # Messages of unknown groups only register the group, their media are not needed
+        to_fetch = [
+            message for message in messages
+            if message.get('media_type') and not (message['is_group'] and message['group_status'] is None)
+        ]
+        if not to_fetch:
+            return
+        _logger.info("Fetching media of %d message(s)", len(to_fetch))
+        # Uses the FULL payload data (needs key and message)
+        media_files = self.env['whatsapp.evolution.api'].sudo().get_media_files([message['payload'] for message in to_fetch])
+        for message, media_file in zip(to_fetch, media_files):
+            if media_file:
+                cleanup.callback(media_file.close)
+            message['media_file'] = media_file
+
+    @api.model
+    def _post_upsert(self, message):
+        """Resolve the sender and channel of a parsed message and post it."""
+        payload_data = message['payload']
+        key = message['key']
+        remote_jid = message['remote_jid']
+        is_group = message['is_group']
+        text_body = message['text_body']
+        media_content = None
+
+        if is_group and message['group_status'] is None:
+            # Unknown group: auto-create as pending, before any partner lookup
+            WhatsAppGroup = self.env['whatsapp.group'].sudo()
+            _logger.info("New WhatsApp Group detected: %s. Creating pending record.", remote_jid)
+            # Try to get subject from message data if available (rare in upsert w/o metadata)
+            # Some events have 'pushName' but that's sender.
+            # We'll default to JID or try to extract from conversation subject if present (unlikely here)
+            group_name = f"WhatsApp Group ({remote_jid})"
+            
+            group_vals = {
+                'name': group_name,
+                'whatsapp_id': remote_jid,
+                'status': 'pending'
+            }
+            
+            # Fetch Group Icon
+            try:
+                group_pic = self.env['whatsapp.evolution.api'].sudo().fetch_profile_picture(remote_jid)
+                if group_pic:
+                    group_vals['image_128'] = group_pic
+            except Exception as e:
+                _logger.warning("Failed to fetch group icon: %s", str(e))
+            
+            WhatsAppGroup._whatsapp_get_or_create_group(remote_jid, lambda: group_vals)
+            # STOP processing here
+            return {'status': 'pending_approval'}
+
+        if message['media_type']:
+            found_media_type = message['media_type']
+            media_info = payload_data['message'][found_media_type]
+            media_file = message['media_file']
+            if media_file:
+                # Determine filename
+                # Use a default filename WITHOUT extension first, to allow extension fixing logic to run
+                default_name = f"whatsapp_{MEDIA_TYPE_MAP[found_media_type]}"
+                filename = media_info.get('fileName') or default_name
+                
+                # Force extension check if filename is the default one or has no extension
+                if filename == default_name or '.' not in filename:
+                    mime = media_info.get('mimetype', '')
+                    if '/' in mime:
+                        ext = mime.split('/')[-1].split(';')[0]
+                        # Fix common mime extensions
+                        if ext == 'plain': ext = 'txt'
+                        if ext == 'quicktime': ext = 'mov'
+                        filename = f"{filename}.{ext}"
+                
+                media_content = {
+                    'name': filename,
+                    'file': media_file, # Decoded content, spooled to disk when large
+                    'mimetype': media_info.get('mimetype', '').split(';')[0].strip(),
+                }
+                _logger.info("Media Content Prepared: %s", media_content['name'])
+            else:
+                _logger.warning("FAILED: Media download returned nothing")
+            
+        if not text_body and not media_content:
+             _logger.warning("No text or media content found.")
+             return {'status': 'ignored', 'reason': 'no_content'}
+
+        # 1. Start Partner Search Logic (The SENDER)
+        Partner = self.env['res.partner'].sudo()
+        
+        if is_group:
+            # For groups, sender is in 'participant'
+            sender_jid = key.get('participant')
+            if not sender_jid:
+                _logger.warning("Group message without participant key")
+                sender_jid = remote_jid # Fallback, unlikely
+            clean_number = sender_jid.split('@')[0]
+        else:
+            clean_number = remote_jid.split('@')[0]
+        
+        # Single indexed lookup on the normalized number (with or without '+')
+        partner = Partner.browse(Partner._whatsapp_resolve_partner_id(clean_number))
+            
+        if partner:
+             _logger.info("MATCHED Partner: %s (ID: %s) | Phone: %s | Mobile: %s", 
+                          partner.name, partner.id, partner.phone, getattr(partner, 'mobile', 'N/A'))
+            
+        if not partner:
+            if is_group:
+                # User request: Do NOT create contacts for group members
+                # Use a generic 'WhatsApp Group Guest'
+                _logger.info("Unknown group member. Using generic Guest partner.")
+                partner = Partner._whatsapp_get_group_guest()
+                
+                # Prepend sender identity to body
+                sender_name = payload_data.get('pushName') or f"+{clean_number}"
+                if text_body:
+                    text_body = f"*{sender_name}*: {text_body}"
+                elif media_content:
+                    # If it's just media, we can't easily prepend to body if it's strictly an attachment, 
+                    # but we can set caption/body if it was empty.
+                    text_body = f"*{sender_name}* sent an attachment"
+            else:
+                # Private chat: Create actual partner
+                def partner_vals():
+                    _logger.info("Creating new partner for %s", clean_number)
+                    
+                    # Try to get the user's display name from WhatsApp
+                    push_name = payload_data.get('pushName')
+                    partner_name = f"{push_name} (WhatsApp)" if push_name else f'+{clean_number}'
+                    
+                    vals = {
+                        'name': partner_name,
+                        'phone': '+' + clean_number
+                    }
+                    
+                    # Fetch Profile Picture
+                    try:
+                        profile_pic = self.env['whatsapp.evolution.api'].sudo().fetch_profile_picture(remote_jid)
+                        if profile_pic:
+                            vals['image_1920'] = profile_pic
+                    except Exception as e:
+                        _logger.warning("Failed to fetch profile picture: %s", str(e))
+
+                    if 'mobile' in Partner._fields:
+                        vals['mobile'] = '+' + clean_number
+                    return vals
+                    
+                # Parallel webhooks of a new contact create a single partner
+                partner = Partner._whatsapp_get_or_create_partner(clean_number, partner_vals)
+        else:
+             _logger.info("Found existing partner: %s", partner.name)
+
+        # 2. Find or Create Discuss Channel
+        Channel = self.env['discuss.channel'].sudo()
+        
+        # Define Channel Identifier
+        if is_group:
+            # --- START GROUP APPROVAL LOGIC ---
+            # Check if this group is known and accepted
+            WhatsAppGroup = self.env['whatsapp.group'].sudo()
+            wa_group = WhatsAppGroup.search([('whatsapp_id', '=', remote_jid)], limit=1)
+            
+            if wa_group.status != 'accepted':
+                # The cached status was outdated
+                _logger.info("Group %s is %s. Ignoring message.", remote_jid, wa_group.status or 'unknown')
+                return {'status': 'ignored', 'reason': 'group_not_accepted'}
+                
+            # If accepted, continue...
+            # Also update channel_name_prefix from the group name in our DB
+            channel_name_prefix = wa_group.name
+            channel_identifier = remote_jid
+            # --- END GROUP APPROVAL LOGIC ---
+            
+            channel_identifier = remote_jid # Redundant assignment for clarity
+        else:
+            channel_identifier = clean_number # Use digits only for private
+            channel_name_prefix = partner.name
+
+        def channel_vals():
+            _logger.info("Creating new WhatsApp channel for: %s", channel_identifier)
+            
+            # For groups, maybe try to be smarter with name if possible, otherwise generic
+            # Private chat name logic uses Partner Name.
+            # Group chat name: Odoo doesn't know the group subject from here easily without extra API call or parsing generic headers.
+            # We'll use "WhatsApp Group [ID]" for now.
+            name = f'{channel_name_prefix} ({channel_identifier})' if is_group else f'{partner.name} (WhatsApp)'
+            
+            # User Preference: ALL WhatsApp chats (Private or Group) are 'channel' type.
+            # This makes them appear in "Channels" sidebar and allows >2 members (e.g. agents).
+            c_type = 'channel'
+             
+            return {
+                'name': name,
+                'channel_type': c_type,
+                'channel_member_ids': [
+                    (0, 0, {'partner_id': partner.id}),
+                ]
+            }
+
+        # Parallel webhooks of a new conversation create a single channel
+        channel = Channel._whatsapp_get_or_create_channel(channel_identifier, channel_vals)
+        
+        # Ensure sender is in the channel (especially for groups)
+        # Since we use 'channel' type now, we can safely add members (no 2-person limit).
+        if channel._whatsapp_add_member(partner.id):
+             _logger.info("Added partner %s to existing channel", partner.name)
+
+        # 3. Post Message with Attachments
+        post_values = {
+            'body': text_body,
+            'author_id': partner.id,
+            'message_type': 'comment',
+            'subtype_xmlid': 'mail.mt_comment',
+        }
+        
+        # The attachment is copied from the temporary file straight into the filestore
+        attachment_ids = []
+        if media_content:
+            attachment_vals = {
+                'name': media_content['name'],
+                'res_model': 'discuss.channel',
+                'res_id': channel.id,
+            }
+            if media_content['mimetype']:
+                attachment_vals['mimetype'] = media_content['mimetype']
+            attachment = self.env['ir.attachment'].sudo()._whatsapp_create_from_file(media_content['file'], attachment_vals)
+            attachment_ids.append(attachment.id)
+            _logger.info("Attachment prepared for message_post: %s", media_content['name'])
+
+        if attachment_ids:
+            post_values['attachment_ids'] = attachment_ids
+
+        _logger.info("Posting message... Attachments count: %d", len(attachment_ids))
+        channel.message_post(**post_values)
+        
+        return {'status': 'success'}
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import models, fields, api
+
+from .utils import LRUCache
+
+_logger = logging.getLogger(__name__)
+
+# (dbname, remote_jid, message id) of the messages already ingested by this worker
+_seen_messages = LRUCache(maxsize=20000)
+
+
+class WhatsAppMessageDedup(models.Model):
+    """Ids of the inbound WhatsApp messages already accepted by the webhook.
+
+    Evolution redelivers `messages.upsert` events when it does not get an
+    answer in time, the unique constraint guarantees that a redelivered
+    message is only ingested once.
+    """
+    _name = 'whatsapp.message.dedup'
+    _description = 'WhatsApp Message Deduplication'
+    _log_access = False
+
+    remote_jid = fields.Char(string="Remote JID", required=True)
+    message_key = fields.Char(string="Message ID", required=True)
+    received_date = fields.Datetime(string="Received On", default=fields.Datetime.now, index=True)
+
+    # `_claim` relies on this index: ON CONFLICT DO NOTHING needs it to detect a redelivery
+    _message_unique = models.Constraint(
+        'unique(message_key, remote_jid)',
+        'This WhatsApp message was already received.',
+    )
+
+    @api.model
+    def _claim(self, remote_jid, message_key):
+        """Record a message as received. Returns False if it was already received.
+
+        The in-memory LRU answers for the redeliveries seen by this worker,
+        the unique constraint covers the other workers.
+        """
+        if not remote_jid or not message_key:
+            return True
+        cache_key = (self.env.cr.dbname, remote_jid, message_key)
+        if cache_key in _seen_messages:
+            return False
+
+        self.env.cr.execute("""
+            INSERT INTO whatsapp_message_dedup (remote_jid, message_key, received_date)
+                 VALUES (%s, %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT DO NOTHING
+              RETURNING id
+        """, [remote_jid, message_key])
+        if self.env.cr.fetchone():
+            # Only remember it once committed, a rollback must let the retry through
+            self.env.cr.postcommit.add(lambda: _seen_messages.set(cache_key, True))
+            return True
+        _seen_messages.set(cache_key, True)
+        _logger.info("Duplicate WhatsApp message %s from %s ignored", message_key, remote_jid)
+        return False
+
+    @api.autovacuum
+    def _gc_message_keys(self):
+        """Evolution only redelivers recent events, older keys are useless."""
+        self.env.cr.execute("""
+            DELETE FROM whatsapp_message_dedup
+                  WHERE received_date < NOW() AT TIME ZONE 'UTC' - INTERVAL '30 days'
+        """)
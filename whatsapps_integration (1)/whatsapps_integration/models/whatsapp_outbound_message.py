@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+from .evolution_breaker import EvolutionUnavailable
+from .evolution_media import MediaTooLarge
+
+_logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+# Minutes to wait before the next attempt, indexed by the attempt count
+RETRY_DELAYS = [1, 2, 5, 15, 60]
+
+
+class WhatsAppOutboundMessage(models.Model):
+    """Outgoing WhatsApp message waiting to be sent by the dispatcher cron.
+
+    Messages of a same recipient are always sent in creation order: as long
+    as one of them is waiting for a retry, the following ones are held back.
+    """
+    _name = 'whatsapp.outbound.message'
+    _description = 'WhatsApp Outbound Message'
+    _order = 'id'
+
+    channel_id = fields.Many2one('discuss.channel', string="Channel", ondelete='cascade', index=True)
+    message_id = fields.Many2one('mail.message', string="Message", ondelete='set null')
+    recipient = fields.Char(string="Recipient", required=True, index=True, help="Phone number or group JID")
+    message_kind = fields.Selection([
+        ('text', 'Text'),
+        ('media', 'Media'),
+    ], string="Kind", required=True, default='text')
+    body = fields.Text(string="Text / Caption")
+    attachment_id = fields.Many2one('ir.attachment', string="Attachment", ondelete='set null')
+    media_type = fields.Char(string="Media Type")
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('retrying', 'Retrying'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ], string="Status", default='queued', required=True, index=True)
+    attempt_count = fields.Integer(string="Attempts", default=0)
+    next_attempt_date = fields.Datetime(string="Next Attempt")
+    sent_date = fields.Datetime(string="Sent On")
+    last_error = fields.Text(string="Last Error")
+
+    @api.model
+    def _enqueue(self, vals_list):
+        """Create queued messages and wake up the dispatcher once the transaction is committed."""
+        messages = self.create(vals_list)
+        if messages:
+            self.env.ref('whatsapps_integration.ir_cron_whatsapp_outbound_dispatch')._trigger()
+        return messages
+
+    def action_retry(self):
+        """Put failed messages back in the queue."""
+        self.filtered(lambda m: m.state == 'failed').write({
+            'state': 'queued',
+            'attempt_count': 0,
+            'next_attempt_date': False,
+        })
+        self.env.ref('whatsapps_integration.ir_cron_whatsapp_outbound_dispatch')._trigger()
+        return True
+
+    @api.model
+    def _cron_dispatch(self, batch_size=100):
+        """Send the pending messages, oldest first, in batches."""
+        breaker = self.env['whatsapp.evolution.api']._get_breaker()
+        if breaker and breaker.is_open():
+            _logger.info("WhatsApp outbound dispatch postponed, the Evolution API circuit is open")
+            return 0
+        now = fields.Datetime.now()
+        pending_domain = [('state', 'in', ('queued', 'retrying'))]
+        # Recipients with a message waiting for its retry delay are blocked,
+        # sending their later messages now would break the ordering.
+        blocked = set(self.search(pending_domain + [('next_attempt_date', '>', now)]).mapped('recipient'))
+        domain = pending_domain + ['|', ('next_attempt_date', '=', False), ('next_attempt_date', '<=', now)]
+        if blocked:
+            domain.append(('recipient', 'not in', list(blocked)))
+        messages = self.search(domain, limit=batch_size)
+
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        sent_count = failed_count = 0
+        unavailable = False
+        for recipient, recipient_messages in messages.grouped('recipient').items():
+            for message in recipient_messages.sorted('id'):
+                outcome = message._send()
+                if outcome is None:
+                    # Circuit open: everything stays queued for the next run
+                    unavailable = True
+                    break
+                if outcome:
+                    sent_count += 1
+                else:
+                    failed_count += 1
+                if auto_commit:
+                    self.env.cr.commit()
+                if message.state == 'retrying':
+                    # Keep the following messages of this recipient for later
+                    break
+            if unavailable:
+                break
+
+        _logger.info("WhatsApp outbound dispatch: %d sent, %d failed", sent_count, failed_count)
+        if len(messages) == batch_size and not unavailable:
+            self.env.ref('whatsapps_integration.ir_cron_whatsapp_outbound_dispatch')._trigger()
+        return sent_count
+
+    def _send(self):
+        """Send a single message and record the outcome.
+
+        Returns True on success, False on failure, None when the Evolution API
+        circuit is open: the message is then left untouched, without using an attempt.
+        """
+        self.ensure_one()
+        api_service = self.env['whatsapp.evolution.api'].sudo()
+        permanent = False
+        try:
+            if self.message_kind == 'media':
+                if not self.attachment_id:
+                    raise ValueError("The attachment of this message no longer exists.")
+                # Streamed from the filestore (or sent by URL), never as a base64 string
+                result = api_service.send_attachment(
+                    phone=self.recipient,
+                    attachment=self.attachment_id,
+                    media_type=self.media_type or 'document',
+                    caption=self.body or '',
+                )
+            else:
+                result = api_service.send_message(self.recipient, self.body or '')
+            error = result.get('error') if isinstance(result, dict) else None
+        except EvolutionUnavailable:
+            return None
+        except MediaTooLarge as e:
+            error, permanent = str(e), True
+        except Exception as e:
+            error = str(e)
+
+        if not error:
+            self.write({
+                'state': 'sent',
+                'sent_date': fields.Datetime.now(),
+                'attempt_count': self.attempt_count + 1,
+                'last_error': False,
+            })
+            return True
+
+        attempt_count = self.attempt_count + 1
+        _logger.warning("Failed to send WhatsApp message %s to %s (attempt %d): %s", self.id, self.recipient, attempt_count, error)
+        if permanent or attempt_count >= MAX_ATTEMPTS:
+            self.write({'state': 'failed', 'attempt_count': attempt_count, 'last_error': error, 'next_attempt_date': False})
+        else:
+            delay = RETRY_DELAYS[min(attempt_count, len(RETRY_DELAYS)) - 1]
+            self.write({
+                'state': 'retrying',
+                'attempt_count': attempt_count,
+                'last_error': error,
+                'next_attempt_date': fields.Datetime.now() + timedelta(minutes=delay),
+            })
+        return False
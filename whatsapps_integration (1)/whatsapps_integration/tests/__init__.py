@@ -0,0 +1,12 @@
+from . import test_evolution_session
+from . import test_evolution_media
+from . import test_message_dedup
+from . import test_avatar_cache
+from . import test_group_sync
+from . import test_broadcast
+from . import test_evolution_api
+from . import test_circuit_breaker
+from . import test_discuss_channel
+from . import test_get_or_create
+from . import test_group_status
+from . import test_webhook_prefilter
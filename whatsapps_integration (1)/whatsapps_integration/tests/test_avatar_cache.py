@@ -0,0 +1,83 @@
+import base64
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import common, tagged
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestAvatarCache(common.TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        params = cls.env["ir.config_parameter"].sudo()
+        params.set_param("whatsapp.evolution_api_url", "https://evolution.example.com")
+        params.set_param("whatsapp.evolution_api_token", "token")
+        params.set_param("whatsapp.evolution_avatar_ttl_hours", "24")
+        cls.Api = cls.env["whatsapp.evolution.api"]
+        cls.Cache = cls.env["whatsapp.avatar.cache"]
+
+    def _patch_api(self, urls, contents):
+        """Serve the picture URLs and CDN contents from the given dicts, counting the calls."""
+        self.calls = {"url": 0, "download": 0}
+
+        def fetch_url(api, jid):
+            self.calls["url"] += 1
+            return urls[jid]
+
+        def download(api, url, etag=None):
+            self.calls["download"] += 1
+            if etag and etag == contents[url][1]:
+                return None, etag
+            return contents[url]
+
+        ApiModel = type(self.Api)
+        self.startPatcher(patch.object(ApiModel, "fetch_profile_picture_url", fetch_url))
+        self.startPatcher(patch.object(ApiModel, "download_profile_picture", download))
+
+    def _expire(self, jid):
+        self.Cache.search([("jid", "=", jid)]).fetch_date = fields.Datetime.now() - timedelta(hours=25)
+
+    def test_picture_is_cached_within_ttl(self):
+        self._patch_api({"1@s.whatsapp.net": "https://cdn/1.jpg"}, {"https://cdn/1.jpg": (b"jpeg-1", '"v1"')})
+        first = self.Api.fetch_profile_picture("1@s.whatsapp.net")
+        second = self.Api.fetch_profile_picture("1@s.whatsapp.net")
+        self.assertEqual(base64.b64decode(first), b"jpeg-1")
+        self.assertEqual(second, first)
+        self.assertEqual(self.calls, {"url": 1, "download": 1})
+
+    def test_missing_picture_is_negatively_cached(self):
+        self._patch_api({"2@s.whatsapp.net": ""}, {})
+        self.assertIsNone(self.Api.fetch_profile_picture("2@s.whatsapp.net"))
+        self.assertIsNone(self.Api.fetch_profile_picture("2@s.whatsapp.net"))
+        self.assertEqual(self.calls, {"url": 1, "download": 0})
+
+    def test_unchanged_picture_is_not_rewritten(self):
+        contents = {"https://cdn/3.jpg": (b"jpeg-3", '"v3"')}
+        self._patch_api({"3@s.whatsapp.net": "https://cdn/3.jpg"}, contents)
+        self.Api.fetch_profile_picture("3@s.whatsapp.net")
+        entry = self.Cache.search([("jid", "=", "3@s.whatsapp.net")])
+        checksum = entry.checksum
+
+        # Expired: revalidated with the ETag, nothing downloaded
+        self._expire("3@s.whatsapp.net")
+        self.Api.fetch_profile_picture("3@s.whatsapp.net")
+        self.assertEqual(self.calls, {"url": 2, "download": 2})
+        self.assertEqual(entry.checksum, checksum)
+
+        # Changed picture: the new content replaces the cached one
+        contents["https://cdn/3.jpg"] = (b"jpeg-3-new", '"v4"')
+        self._expire("3@s.whatsapp.net")
+        picture = self.Api.fetch_profile_picture("3@s.whatsapp.net")
+        self.assertEqual(base64.b64decode(picture), b"jpeg-3-new")
+        self.assertNotEqual(entry.checksum, checksum)
+
+    def test_api_error_keeps_last_picture(self):
+        urls = {"4@s.whatsapp.net": "https://cdn/4.jpg"}
+        self._patch_api(urls, {"https://cdn/4.jpg": (b"jpeg-4", None)})
+        picture = self.Api.fetch_profile_picture("4@s.whatsapp.net")
+        urls["4@s.whatsapp.net"] = None
+        self._expire("4@s.whatsapp.net")
+        self.assertEqual(self.Api.fetch_profile_picture("4@s.whatsapp.net"), picture)
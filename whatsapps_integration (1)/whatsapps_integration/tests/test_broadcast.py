@@ -0,0 +1,80 @@
+import threading
+import time
+from unittest.mock import patch
+
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models import whatsapp_broadcast
+from odoo.addons.whatsapps_integration.models.utils import TokenBucket
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestBroadcast(common.TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        params = cls.env["ir.config_parameter"].sudo()
+        params.set_param("whatsapp.evolution_api_url", "https://evolution.example.com")
+        params.set_param("whatsapp.evolution_api_token", "token")
+        cls.partners = cls.env["res.partner"].create([
+            {"name": f"Customer {i}", "phone": f"+32 470 00 00 {i:02d}"} for i in range(6)
+        ] + [
+            {"name": "Duplicate", "phone": "0032470000000"},
+            {"name": "No phone"},
+        ])
+
+    def _run(self, broadcast, failing=()):
+        self.sent = []
+        lock = threading.Lock()
+
+        def send_text(config, session, phone, message, delay=None):
+            with lock:
+                self.sent.append((phone, message))
+            return {"error": "boom"} if phone in failing else {"key": {"id": phone}}
+
+        with patch.object(whatsapp_broadcast, "_send_text", send_text):
+            self.env["whatsapp.broadcast"]._cron_process(batch_size=4)
+        broadcast.invalidate_recordset()
+
+    def test_token_bucket_paces_calls(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _i in range(11):
+            bucket.acquire()
+        # The first token is free, the next ten take 1/100s each
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_broadcast_renders_and_sends_every_number_once(self):
+        broadcast = self.env["whatsapp.evolution.api"].broadcast(
+            self.partners, "Hello {{ object.name }}", rate_per_minute=6000)
+        self.assertEqual(broadcast.state, "running")
+        self.assertEqual(broadcast.recipient_count, 6)
+
+        self._run(broadcast)
+        self.assertEqual(broadcast.state, "done")
+        self.assertEqual(broadcast.sent_count, 6)
+        self.assertEqual(
+            sorted(self.sent),
+            sorted((f"324700000{i:02d}", f"Hello Customer {i}") for i in range(6)),
+        )
+
+    def test_failed_recipients_can_be_resumed(self):
+        broadcast = self.env["whatsapp.evolution.api"].broadcast(
+            self.partners, "Hi", rate_per_minute=6000)
+        self._run(broadcast, failing={"32470000003"})
+        self.assertEqual((broadcast.sent_count, broadcast.failed_count), (5, 1))
+        self.assertEqual(broadcast.recipient_ids.filtered(lambda r: r.state == "failed").error, "boom")
+
+        broadcast.action_retry_failed()
+        self._run(broadcast)
+        self.assertEqual((broadcast.sent_count, broadcast.failed_count), (6, 0))
+        # Only the failed recipient was sent again
+        self.assertEqual(self.sent, [("32470000003", "Hi")])
+
+    def test_paused_broadcast_is_not_sent(self):
+        broadcast = self.env["whatsapp.evolution.api"].broadcast(self.partners, "Hi")
+        broadcast.action_pause()
+        self._run(broadcast)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(broadcast.pending_count, 6)
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+
+import requests
+
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models.evolution_breaker import (
+    CircuitBreaker, EvolutionUnavailable, GuardedSession,
+)
+
+BASE_URL = "https://evolution.example.com"
+
+
+class FlakySession:
+    """Pooled session stand-in, down until `up` is set."""
+
+    def __init__(self):
+        self.up = False
+        self.calls = 0
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        self.calls += 1
+        if not self.up:
+            raise requests.exceptions.ConnectTimeout("timed out")
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestCircuitBreaker(common.TransactionCase):
+
+    @contextmanager
+    def _test_cursor(self):
+        # The breaker cursors commit, keep their writes in the test transaction
+        with self.env.cr.savepoint():
+            yield self.env.cr
+
+    def _breaker(self, key):
+        return CircuitBreaker(self.env.cr.dbname, key, threshold=3, reset_seconds=30, cursor_factory=self._test_cursor)
+
+    def _guarded(self, key):
+        breaker = self._breaker(key)
+        return GuardedSession(FlakySession(), breaker, BASE_URL), breaker
+
+    def _expire_pause(self, key):
+        self.env.cr.execute("""
+            UPDATE whatsapp_circuit_breaker
+               SET changed_at = changed_at - INTERVAL '1 minute'
+             WHERE name = %s
+        """, [key])
+
+    def test_circuit_opens_and_fails_fast(self):
+        session, breaker = self._guarded("test-open")
+        for _i in range(3):
+            with self.assertRaises(requests.exceptions.ConnectTimeout):
+                session.get(f"{BASE_URL}/instance/connectionState/Odoo")
+        self.assertEqual(breaker.get_state(refresh=True).state, "open")
+
+        with self.assertRaises(EvolutionUnavailable):
+            session.get(f"{BASE_URL}/instance/connectionState/Odoo")
+        # The server was not called while open
+        self.assertEqual(session.session.calls, 3)
+        # Other hosts are not guarded
+        with self.assertRaises(requests.exceptions.ConnectTimeout):
+            session.get("https://pps.whatsapp.net/picture.jpg")
+
+    def test_half_open_probe_closes_the_circuit(self):
+        session, breaker = self._guarded("test-probe")
+        for _i in range(3):
+            with self.assertRaises(requests.exceptions.ConnectTimeout):
+                session.get(f"{BASE_URL}/instance/connectionState/Odoo")
+        self._expire_pause("test-probe")
+        breaker.get_state(refresh=True)
+
+        # A failed probe opens the circuit again
+        with self.assertRaises(requests.exceptions.ConnectTimeout):
+            session.get(f"{BASE_URL}/instance/connectionState/Odoo")
+        self.assertEqual(breaker.get_state(refresh=True).state, "open")
+        self.assertTrue(breaker.is_open())
+
+        self._expire_pause("test-probe")
+        breaker.get_state(refresh=True)
+        self.assertTrue(breaker.allow())
+        # Only one caller probes, the others keep failing fast
+        other = self._breaker("test-probe")
+        self.assertFalse(other.allow())
+
+        session.session.up = True
+        session.get(f"{BASE_URL}/instance/connectionState/Odoo")
+        state = breaker.get_state(refresh=True)
+        self.assertEqual((state.state, state.failure_count), ("closed", 0))
+
+    def test_open_circuit_keeps_outbound_messages_queued(self):
+        # The breaker of the model opens its cursors from the registry
+        self.registry.enter_test_mode(self.env.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+        params = self.env["ir.config_parameter"].sudo()
+        params.set_param("whatsapp.evolution_api_url", "https://breaker-outbound.example.com")
+        params.set_param("whatsapp.evolution_api_token", "token")
+        breaker = self.env["whatsapp.evolution.api"]._get_breaker()
+        for _i in range(breaker.threshold):
+            breaker.record_failure("timed out")
+
+        message = self.env["whatsapp.outbound.message"].create({"recipient": "32470123456", "body": "Hello"})
+        self.env["whatsapp.outbound.message"]._cron_dispatch()
+        self.assertEqual((message.state, message.attempt_count), ("queued", 0))
+
+        result = self.env["whatsapp.evolution.api"].test_connection()
+        self.assertEqual(result["breaker"], "open")
@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+from odoo.modules.migration import load_script
+from odoo.tests import common, tagged
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestDiscussChannel(common.TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env["res.partner"].create({"name": "Member", "phone": "+32 470 11 22 33"})
+        cls.channel = cls.env["discuss.channel"].create({
+            "name": "Member (WhatsApp)",
+            "channel_type": "channel",
+            "whatsapp_number": "+32 470 11 22 33",
+        })
+
+    def test_add_member_is_idempotent(self):
+        self.assertFalse(self.channel._whatsapp_is_member(self.partner.id))
+        self.assertTrue(self.channel._whatsapp_add_member(self.partner.id))
+        self.assertTrue(self.channel._whatsapp_is_member(self.partner.id))
+        self.assertFalse(self.channel._whatsapp_add_member(self.partner.id))
+        self.assertEqual(self.channel.channel_member_ids.partner_id, self.partner)
+
+    def test_concurrent_member_insert_is_ignored(self):
+        # Another transaction added the member after our existence check
+        self.env["discuss.channel.member"].create({"channel_id": self.channel.id, "partner_id": self.partner.id})
+        with patch.object(type(self.channel), "_whatsapp_is_member", lambda channel, partner_id: False):
+            self.assertFalse(self.channel._whatsapp_add_member(self.partner.id))
+        self.assertEqual(len(self.channel.channel_member_ids.filtered(lambda m: m.partner_id == self.partner)), 1)
+
+    def test_migration_merges_duplicate_channels(self):
+        # Channels created before the unique index existed
+        self.env.cr.execute("ALTER TABLE discuss_channel DROP CONSTRAINT discuss_channel_whatsapp_number_unique")
+        other = self.env["res.partner"].create({"name": "Agent"})
+        self.channel._whatsapp_add_member(self.partner.id)
+        duplicates = self.env["discuss.channel"].create([
+            {"name": "Duplicate 1", "channel_type": "channel"},
+            {"name": "Duplicate 2", "channel_type": "channel"},
+        ])
+        for duplicate in duplicates:
+            duplicate._whatsapp_add_member(self.partner.id)
+            duplicate._whatsapp_add_member(other.id)
+        message = duplicates[1].message_post(body="Hello")
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE discuss_channel SET whatsapp_number = %s WHERE id IN %s",
+                            ["0032470112233", tuple(duplicates.ids)])
+
+        migration = load_script("whatsapps_integration/migrations/19.0.1.1.0/pre-migrate.py", "whatsapps_integration")
+        migration._merge_whatsapp_channels(self.env.cr)
+        self.env.invalidate_all()
+
+        self.assertFalse(duplicates.exists())
+        self.assertEqual(self.channel.whatsapp_number, "32470112233")
+        self.assertEqual(message.res_id, self.channel.id)
+        members = self.env["discuss.channel.member"].search([("channel_id", "=", self.channel.id)])
+        self.assertLessEqual(self.partner | other, members.partner_id)
+        self.assertEqual(len(members), len(members.partner_id))
@@ -0,0 +1,83 @@
+import json
+
+import requests
+
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models import evolution_api
+
+
+def make_response(status, payload=None):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "Bad Request" if status == 400 else "OK"
+    response.url = "https://evolution.example.com/message/sendText/Odoo"
+    response._content = json.dumps(payload or {}).encode()
+    return response
+
+
+class FakeSession:
+    """Answers 200 to the payload shape the server accepts, 400 to the other one."""
+
+    def __init__(self, accepted):
+        self.accepted = accepted
+        self.payloads = []
+
+    def post(self, url, endpoint=None, headers=None, json=None):
+        self.payloads.append(json)
+        shape = "text_message" if "textMessage" in json else "text"
+        return make_response(200, {"key": {"id": "1"}}) if shape == self.accepted else make_response(400)
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestTextDialect(common.TransactionCase):
+
+    def _config(self, url):
+        params = self.env["ir.config_parameter"].sudo()
+        params.set_param("whatsapp.evolution_api_url", url)
+        params.set_param("whatsapp.evolution_api_token", "token")
+        return self.env["whatsapp.evolution.api"]._get_config()
+
+    def test_accepted_dialect_is_remembered(self):
+        config = self._config("https://dialect-v2.example.com")
+        session = FakeSession(accepted="text_message")
+        stats = dict(evolution_api.get_text_dialect_stats())
+
+        evolution_api._send_text(config, session, "+32 470 12 34 56", "first")
+        self.assertEqual(len(session.payloads), 2)
+        for i in range(3):
+            evolution_api._send_text(config, session, "+32 470 12 34 56", f"next {i}")
+        # One request per message once the shape is known
+        self.assertEqual(len(session.payloads), 5)
+        self.assertEqual(session.payloads[-1]["textMessage"], {"text": "next 2"})
+
+        after = evolution_api.get_text_dialect_stats()
+        self.assertEqual(after["hits"] - stats["hits"], 3)
+        self.assertEqual(after["misses"] - stats["misses"], 1)
+
+    def test_dialect_is_reprobed_when_the_server_changes(self):
+        config = self._config("https://dialect-upgrade.example.com")
+        session = FakeSession(accepted="text_message")
+        evolution_api._send_text(config, session, "32470123456", "before upgrade")
+
+        session.accepted = "text"
+        result = evolution_api._send_text(config, session, "32470123456", "after upgrade")
+        self.assertNotIn("error", result)
+        count = len(session.payloads)
+        evolution_api._send_text(config, session, "32470123456", "steady")
+        self.assertEqual(len(session.payloads), count + 1)
+        self.assertEqual(session.payloads[-1]["text"], "steady")
+
+    def test_rejected_message_keeps_the_cached_dialect(self):
+        config = self._config("https://dialect-reject.example.com")
+        session = FakeSession(accepted="text")
+        evolution_api._send_text(config, session, "32470123456", "ok")
+
+        session.accepted = None
+        result = evolution_api._send_text(config, session, "32470123456", "invalid number")
+        self.assertIn("error", result)
+
+        session.accepted = "text"
+        count = len(session.payloads)
+        evolution_api._send_text(config, session, "32470123456", "ok again")
+        self.assertEqual(len(session.payloads), count + 1)
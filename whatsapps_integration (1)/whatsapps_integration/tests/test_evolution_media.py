@@ -0,0 +1,142 @@
+import base64
+import io
+import json
+import os
+import threading
+import time
+from collections import Counter
+from unittest.mock import patch
+
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models import evolution_api
+from odoo.addons.whatsapps_integration.models.evolution_media import (
+    CHUNK_SIZE, Base64JsonBody, Base64StreamDecoder, MediaTooLarge, iter_json_string_field,
+)
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestEvolutionMedia(common.TransactionCase):
+
+    def test_streamed_base64_response_is_decoded(self):
+        content = os.urandom(300_000)
+        response = json.dumps({
+            "mediaType": "imageMessage",
+            "base64": "data:image/jpeg;base64," + base64.b64encode(content).decode(),
+            "mimetype": "image/jpeg",
+        }).encode()
+        # Odd chunk sizes split the key, the data URI header and base64 quanta
+        for chunk_size in (7, 1021, 65536):
+            out = io.BytesIO()
+            decoder = Base64StreamDecoder(out, max_bytes=len(content))
+            for piece in iter_json_string_field(split(response, chunk_size), "base64"):
+                decoder.feed(piece)
+            decoder.close()
+            self.assertEqual(out.getvalue(), content)
+
+    def test_media_answered_under_data_key_is_decoded(self):
+        params = self.env["ir.config_parameter"].sudo()
+        params.set_param("whatsapp.evolution_api_url", "https://evolution.example.com")
+        params.set_param("whatsapp.evolution_api_token", "token")
+        config = self.env["whatsapp.evolution.api"]._get_config()
+        content = os.urandom(50_000)
+        body = json.dumps({"mimetype": "image/jpeg", "data": base64.b64encode(content).decode()}).encode()
+
+        class Response:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def raise_for_status(self):
+                pass
+
+            def iter_content(self, chunk_size):
+                return iter(split(body, chunk_size))
+
+        class Session:
+            def post(self, url, **kwargs):
+                return Response()
+
+        media_file = evolution_api._download_media(config, Session(), {"key": {"id": "1"}, "message": {}})
+        self.assertEqual(media_file.read(), content)
+
+    def test_download_ceiling_is_enforced(self):
+        content = os.urandom(10_000)
+        out = io.BytesIO()
+        decoder = Base64StreamDecoder(out, max_bytes=4096)
+        with self.assertRaises(MediaTooLarge):
+            for piece in split(base64.b64encode(content), 1024):
+                decoder.feed(piece)
+        # Nothing past the ceiling was kept
+        self.assertLessEqual(len(out.getvalue()), 4096)
+
+    def test_upload_body_is_streamed(self):
+        content = os.urandom(CHUNK_SIZE * 3 + 5)
+        body = Base64JsonBody({"number": "32470123456", "fileName": "a.bin"}, lambda: io.BytesIO(content), len(content))
+        chunks = list(body)
+        # Bounded memory: no chunk is bigger than one encoded read
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 4 * CHUNK_SIZE // 3)
+        raw = b"".join(chunks)
+        self.assertEqual(len(raw), len(body))
+        payload = json.loads(raw)
+        self.assertEqual(payload["number"], "32470123456")
+        self.assertEqual(base64.b64decode(payload["media"]), content)
+        # Re-iterable, so that the session can replay it on retry
+        self.assertEqual(b"".join(body), raw)
+
+    def test_send_attachment_refuses_media_over_the_limit(self):
+        params = self.env["ir.config_parameter"].sudo()
+        params.set_param("whatsapp.evolution_api_url", "https://evolution.example.com")
+        params.set_param("whatsapp.evolution_api_token", "token")
+        params.set_param("whatsapp.evolution_media_max_mb", "1")
+        attachment = self.env["ir.attachment"].create({
+            "name": "big.bin",
+            "raw": b"\0" * (1024 * 1024 + 1),
+        })
+        with self.assertRaises(MediaTooLarge):
+            self.env["whatsapp.evolution.api"].send_attachment("32470123456", attachment, "document")
+
+    def test_attachment_created_from_file(self):
+        content = os.urandom(200_000)
+        attachment = self.env["ir.attachment"]._whatsapp_create_from_file(io.BytesIO(content), {
+            "name": "photo.jpg",
+            "mimetype": "image/jpeg",
+        })
+        self.assertEqual(attachment.raw, content)
+        self.assertEqual(attachment.file_size, len(content))
+        self.assertEqual(attachment.checksum, attachment._compute_checksum(content))
+
+    def test_batch_media_are_downloaded_concurrently_in_order(self):
+        params = self.env["ir.config_parameter"].sudo()
+        params.set_param("whatsapp.evolution_api_url", "https://evolution.example.com")
+        params.set_param("whatsapp.evolution_api_token", "token")
+        messages = [
+            {"key": {"id": str(i)}, "message": {"mediaUrl": f"https://cdn{i % 2}.example.com/{i}.jpg"}}
+            for i in range(12)
+        ]
+        lock = threading.Lock()
+        running = Counter()
+        peak = Counter()
+
+        def download(config, session, message_object):
+            host = message_object["message"]["mediaUrl"].split("/")[2]
+            with lock:
+                running[host] += 1
+                peak[host] = max(peak[host], running[host])
+            # Later messages finish first, the results must keep the input order
+            time.sleep(0.01 * (12 - int(message_object["key"]["id"])))
+            with lock:
+                running[host] -= 1
+            return io.BytesIO(message_object["key"]["id"].encode())
+
+        with patch.object(evolution_api, "_download_media", download):
+            files = self.env["whatsapp.evolution.api"].get_media_files(messages)
+        self.assertEqual([f.read() for f in files], [str(i).encode() for i in range(12)])
+        self.assertLessEqual(max(peak.values()), evolution_api.MEDIA_HOST_CONCURRENCY)
+        self.assertGreater(max(peak.values()), 1)
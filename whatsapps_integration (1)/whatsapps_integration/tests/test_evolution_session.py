@@ -0,0 +1,31 @@
+from unittest.mock import patch
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models.evolution_session import EvolutionSession
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestEvolutionSession(common.TransactionCase):
+
+    def _attempts(self, method, error):
+        session = EvolutionSession(max_retries=2)
+        with patch.object(session, "_sleep_backoff"), \
+                patch.object(session.session, "request", side_effect=error) as request:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                session.request(method, "http://evolution.test/message/sendText/main")
+        return request.call_count
+
+    def test_aborted_post_is_not_retried(self):
+        # The server may have received the message before the connection dropped
+        aborted = requests.exceptions.ConnectionError(ConnectionResetError("Connection aborted"))
+        self.assertEqual(self._attempts("POST", aborted), 1)
+        self.assertEqual(self._attempts("GET", aborted), 3)
+
+    def test_refused_post_is_retried(self):
+        refused = requests.exceptions.ConnectionError(
+            MaxRetryError(None, "/message/sendText/main", NewConnectionError(None, "Connection refused")))
+        self.assertEqual(self._attempts("POST", refused), 3)
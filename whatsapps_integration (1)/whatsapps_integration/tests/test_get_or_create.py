@@ -0,0 +1,75 @@
+from odoo.exceptions import ConcurrencyError
+from odoo.modules.migration import load_script
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models.utils import get_or_create
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestGetOrCreate(common.TransactionCase):
+
+    def test_partner_is_created_once(self):
+        Partner = self.env["res.partner"]
+        created = []
+
+        def vals():
+            created.append(True)
+            return {"name": "New contact", "phone": "+32 470 55 66 77"}
+
+        partner = Partner._whatsapp_get_or_create_partner("32470556677", vals)
+        again = Partner._whatsapp_get_or_create_partner("+32 470 55 66 77", vals)
+        self.assertEqual(again, partner)
+        self.assertEqual(len(created), 1)
+
+    def test_channel_is_created_once(self):
+        Channel = self.env["discuss.channel"]
+        vals = lambda: {"name": "Chat", "channel_type": "channel"}  # noqa: E731
+        channel = Channel._whatsapp_get_or_create_channel("+32 470 55 66 78", vals)
+        self.assertEqual(channel.whatsapp_number, "32470556678")
+        self.assertEqual(Channel._whatsapp_get_or_create_channel("32470556678@s.whatsapp.net", vals), channel)
+
+    def test_creation_committed_after_snapshot_is_retried(self):
+        other = self.env["res.partner"].create({"name": "Created by another worker"})
+
+        def find(env):
+            # Only a fresh snapshot sees the other worker's partner
+            return other if env.cr is not self.env.cr else env["res.partner"]
+
+        with self.assertRaises(ConcurrencyError):
+            get_or_create(self.env, "whatsapp.test:retry", find, lambda: self.fail("must not create"))
+
+    def test_group_guest_is_shared(self):
+        guest = self.env["res.partner"]._whatsapp_get_group_guest()
+        self.assertEqual(self.env["res.partner"]._whatsapp_get_group_guest(), guest)
+
+    def test_group_guest_is_the_data_record(self):
+        Partner = self.env["res.partner"]
+        guest = self.env.ref("whatsapps_integration.partner_whatsapp_group_guest")
+        guest.name = "Renamed guest"
+        self.assertEqual(Partner._whatsapp_get_group_guest(), guest)
+
+    def test_group_guest_is_recreated(self):
+        Partner = self.env["res.partner"]
+        Partner._whatsapp_get_group_guest().unlink()
+        guest = Partner._whatsapp_get_group_guest()
+        self.assertTrue(guest.exists())
+        self.assertEqual(self.env.ref("whatsapps_integration.partner_whatsapp_group_guest"), guest)
+
+    def test_migration_binds_the_existing_guest(self):
+        Partner = self.env["res.partner"]
+        self.env.ref("whatsapps_integration.partner_whatsapp_group_guest").name = "Former data record"
+        # The guest of earlier versions, then the one created by the data file
+        old_guest = Partner.create({"name": "WhatsApp Group Guest"})
+        new_guest = Partner.create({"name": "WhatsApp Group Guest"})
+        self.env["ir.model.data"].search([
+            ("module", "=", "whatsapps_integration"), ("name", "=", "partner_whatsapp_group_guest"),
+        ]).res_id = new_guest.id
+        message = self.env["mail.message"].create({"author_id": new_guest.id, "body": "Hello"})
+
+        migration = load_script("whatsapps_integration/migrations/19.0.1.1.0/post-migrate.py", "whatsapps_integration")
+        migration._bind_group_guest(self.env)
+
+        self.assertEqual(self.env.ref("whatsapps_integration.partner_whatsapp_group_guest"), old_guest)
+        self.assertEqual(Partner._whatsapp_get_group_guest(), old_guest)
+        self.assertFalse(new_guest.exists())
+        self.assertEqual(message.author_id, old_guest)
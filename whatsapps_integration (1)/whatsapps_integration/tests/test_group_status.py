@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models.whatsapp_group import _group_status_by_jid
+
+
+def _upsert(jid, text="Hello"):
+    return {
+        "event": "messages.upsert",
+        "data": {
+            "key": {"remoteJid": jid, "participant": "32470000001@s.whatsapp.net", "id": "MSG1"},
+            "message": {"conversation": text},
+        },
+    }
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestGroupStatus(common.TransactionCase):
+
+    def test_status_cache_is_invalidated(self):
+        Group = self.env["whatsapp.group"]
+        self.assertIsNone(Group._whatsapp_group_status("10@g.us"))
+        group = Group.create({"name": "Noisy", "whatsapp_id": "10@g.us"})
+        self.assertEqual(Group._whatsapp_group_status("10@g.us"), "pending")
+        group.action_reject()
+        self.assertEqual(Group._whatsapp_group_status("10@g.us"), "rejected")
+        group.status = "accepted"
+        self.assertEqual(Group._whatsapp_group_status("10@g.us"), "accepted")
+        group.unlink()
+        self.assertIsNone(Group._whatsapp_group_status("10@g.us"))
+
+    def test_status_cache_survives_unrelated_writes(self):
+        Group = self.env["whatsapp.group"]
+        group = Group.create({"name": "Quiet", "whatsapp_id": "13@g.us"})
+        cache_key = (self.env.cr.dbname, "13@g.us")
+        self.assertEqual(Group._whatsapp_group_status("13@g.us"), "pending")
+        group.write({"name": "Renamed", "status": "pending"})
+        self.assertIn(cache_key, _group_status_by_jid)
+        group.write({"status": "accepted"})
+        self.assertNotIn(cache_key, _group_status_by_jid)
+
+    def test_rejected_group_is_dropped_early(self):
+        self.env["whatsapp.group"].create({"name": "Noisy", "whatsapp_id": "11@g.us", "status": "rejected"})
+        Partner = type(self.env["res.partner"])
+        with patch.object(Partner, "_whatsapp_resolve_partner_id", side_effect=AssertionError("no partner lookup")):
+            result = self.env["whatsapp.inbound.event"]._process_payload(_upsert("11@g.us"))
+        self.assertEqual(result, {"status": "ignored", "reason": "group_not_accepted"})
+
+    def test_unknown_group_is_registered_as_pending(self):
+        ApiModel = type(self.env["whatsapp.evolution.api"])
+        Partner = type(self.env["res.partner"])
+        with patch.object(ApiModel, "fetch_profile_picture", return_value=False), \
+                patch.object(Partner, "_whatsapp_resolve_partner_id", side_effect=AssertionError("no partner lookup")):
+            result = self.env["whatsapp.inbound.event"]._process_payload(_upsert("12@g.us"))
+        self.assertEqual(result, {"status": "pending_approval"})
+        self.assertEqual(self.env["whatsapp.group"]._whatsapp_group_status("12@g.us"), "pending")
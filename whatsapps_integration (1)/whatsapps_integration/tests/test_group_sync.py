@@ -0,0 +1,91 @@
+from unittest.mock import patch
+
+from odoo.modules.migration import load_script
+from odoo.tests import common, tagged
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestGroupSync(common.TransactionCase):
+
+    def _sync(self, groups, incremental=False):
+        ApiModel = type(self.env["whatsapp.evolution.api"])
+        with patch.object(ApiModel, "fetch_all_groups", lambda api: groups):
+            return self.env["whatsapp.group"]._sync_groups(incremental=incremental)
+
+    def test_sync_is_a_diff(self):
+        Group = self.env["whatsapp.group"]
+        Group.create({"name": "Old name", "whatsapp_id": "1@g.us", "status": "accepted"})
+        Group.create({"name": "Same", "whatsapp_id": "2@g.us", "status": "accepted", "avatar_pending": True})
+        stats = self._sync([
+            {"id": "1@g.us", "subject": "New name"},
+            {"id": "2@g.us", "subject": "Same"},
+            {"id": "3@g.us", "subject": "Brand new"},
+            {"id": "4@g.us", "subject": "Unknown Group"},
+        ])
+        self.assertEqual(stats["fetched"], 4)
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["renamed"], 1)
+        self.assertEqual(set(stats["timings"]), {"fetch", "diff", "write", "queue"})
+
+        groups = Group.search([("whatsapp_id", "in", ["1@g.us", "2@g.us", "3@g.us", "4@g.us"])])
+        self.assertEqual(
+            {g.whatsapp_id: (g.name, g.status) for g in groups},
+            {
+                "1@g.us": ("New name", "accepted"),
+                "2@g.us": ("Same", "accepted"),
+                "3@g.us": ("Brand new", "pending"),
+                "4@g.us": ("Unknown Group", "pending"),
+            },
+        )
+        # Icons are left to the avatar cron
+        self.assertTrue(all(groups.mapped("avatar_pending")))
+
+    def test_second_sync_writes_nothing(self):
+        groups = [{"id": "5@g.us", "subject": "Stable"}]
+        self._sync(groups)
+        stats = self._sync(groups)
+        self.assertEqual((stats["created"], stats["renamed"]), (0, 0))
+
+    def test_incremental_sync_skips_unchanged_groups(self):
+        Group = self.env["whatsapp.group"]
+        groups = [
+            {"id": "6@g.us", "subject": "Six", "picture_url": "https://pps.whatsapp.net/6.jpg?oe=1"},
+            {"id": "7@g.us", "subject": "Seven", "picture_url": ""},
+        ]
+        self._sync(groups)
+        Group.search([("whatsapp_id", "in", ["6@g.us", "7@g.us"])]).avatar_pending = False
+
+        # Only the signature of the picture URL changed: nothing to do
+        groups[0]["picture_url"] = "https://pps.whatsapp.net/6.jpg?oe=2"
+        stats = self._sync(groups, incremental=True)
+        self.assertEqual((stats["skipped"], stats["created"], stats["renamed"]), (2, 0, 0))
+
+        groups[1]["subject"] = "Seven renamed"
+        groups.append({"id": "8@g.us", "subject": "Eight", "picture_url": ""})
+        stats = self._sync(groups, incremental=True)
+        self.assertEqual((stats["skipped"], stats["created"], stats["renamed"]), (1, 1, 1))
+        seven = Group.search([("whatsapp_id", "=", "7@g.us")])
+        self.assertEqual(seven.name, "Seven renamed")
+        self.assertTrue(seven.avatar_pending)
+
+    def test_migration_merges_duplicate_groups(self):
+        # Groups created before the unique index existed
+        self.env.cr.execute("ALTER TABLE whatsapp_group DROP CONSTRAINT whatsapp_group_whatsapp_id_unique")
+        Group = self.env["whatsapp.group"]
+        pending = Group.create({"name": "Pending", "whatsapp_id": "8@g.us"})
+        accepted, rejected = Group.create([
+            {"name": "Accepted", "whatsapp_id": "8-accepted@g.us", "status": "accepted"},
+            {"name": "Rejected", "whatsapp_id": "8-rejected@g.us", "status": "rejected"},
+        ])
+        message = pending.message_post(body="Hello")
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE whatsapp_group SET whatsapp_id = '8@g.us' WHERE id IN %s",
+                            [(accepted.id, rejected.id)])
+
+        migration = load_script("whatsapps_integration/migrations/19.0.1.1.0/pre-migrate.py", "whatsapps_integration")
+        migration._merge_whatsapp_groups(self.env.cr)
+        self.env.invalidate_all()
+
+        self.assertEqual(Group.search([("whatsapp_id", "=", "8@g.us")]), accepted)
+        self.assertFalse((pending | rejected).exists())
+        self.assertEqual(message.res_id, accepted.id)
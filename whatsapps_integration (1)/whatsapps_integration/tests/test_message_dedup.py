@@ -0,0 +1,15 @@
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.models.whatsapp_message_dedup import _seen_messages
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestMessageDedup(common.TransactionCase):
+
+    def test_second_claim_is_refused(self):
+        Dedup = self.env["whatsapp.message.dedup"]
+        self.assertTrue(Dedup._claim("32470000001@s.whatsapp.net", "MSG1"))
+        # Another worker has nothing in its memory, the unique index answers
+        _seen_messages.clear()
+        self.assertFalse(Dedup._claim("32470000001@s.whatsapp.net", "MSG1"))
+        self.assertTrue(Dedup._claim("32470000002@s.whatsapp.net", "MSG1"))
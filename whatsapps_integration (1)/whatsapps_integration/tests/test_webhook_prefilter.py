@@ -0,0 +1,93 @@
+import base64
+import json
+import logging
+import os
+import time
+
+from odoo.tests import common, tagged
+
+from odoo.addons.whatsapps_integration.controllers.webhook_prefilter import peek_event, prefilter
+
+_logger = logging.getLogger(__name__)
+
+
+def _message(from_me=False, media=None, jid="32470000001@s.whatsapp.net"):
+    message = {"conversation": "Hello"}
+    if media:
+        message = {"imageMessage": {"mimetype": "image/jpeg", "caption": ""}, "base64": media}
+    return {
+        "key": {"remoteJid": jid, "fromMe": from_me, "id": os.urandom(8).hex()},
+        "pushName": "Someone",
+        "message": message,
+        "messageType": "imageMessage" if media else "conversation",
+    }
+
+
+def _body(event, data):
+    return json.dumps({"event": event, "instance": "main", "data": data, "sender": "32470000000@s.whatsapp.net"}).encode()
+
+
+# Shapes of the deliveries seen in production, media shrunk to a couple of MB
+RECORDED = {
+    "presence": _body("presence.update", {"id": "32470000001@s.whatsapp.net", "presences": {"32470000001@s.whatsapp.net": {"lastKnownPresence": "composing"}}}),
+    "receipt": _body("messages.update", {"keyId": "ABCDEF", "remoteJid": "32470000001@s.whatsapp.net", "fromMe": True, "status": "READ"}),
+    "connection": _body("connection.update", {"state": "open", "statusReason": 200}),
+    "own_media": _body("messages.upsert", _message(from_me=True, media=base64.b64encode(os.urandom(2_000_000)).decode())),
+    "own_text": _body("messages.upsert", _message(from_me=True)),
+    "incoming_text": _body("messages.upsert", _message()),
+    "incoming_media": _body("messages.upsert", _message(media=base64.b64encode(os.urandom(2_000_000)).decode())),
+    "mixed_batch": _body("messages.upsert", [_message(from_me=True), _message()]),
+}
+
+
+def _full_parse(raw_body):
+    """What the webhook decided from the parsed JSON before the prefilter."""
+    data = json.loads(raw_body)
+    if (data.get("type") or data.get("event")) != "messages.upsert":
+        return "not_upsert"
+    messages = data.get("data") or {}
+    messages = messages if isinstance(messages, list) else [messages]
+    if all(message.get("key", {}).get("fromMe") for message in messages):
+        return "from_me"
+    return None
+
+
+@tagged("whatsapp", "post_install", "-at_install")
+class TestWebhookPrefilter(common.TransactionCase):
+
+    def test_prefilter_agrees_with_full_parse(self):
+        for name, raw_body in RECORDED.items():
+            with self.subTest(payload=name):
+                self.assertEqual(prefilter(raw_body), _full_parse(raw_body))
+
+    def test_ambiguous_bodies_are_parsed(self):
+        # A message key without fromMe flag is not ours
+        message = _message(from_me=True)
+        raw_body = _body("messages.upsert", [message, dict(message, key={"remoteJid": "1@s.whatsapp.net", "id": "X"})])
+        self.assertIsNone(prefilter(raw_body))
+        # Quoting "messages.upsert" in a text does not make it an upsert, the parse decides
+        self.assertIsNone(prefilter(_body("chats.update", {"text": "messages.upsert"})))
+
+    def test_peek_event(self):
+        self.assertEqual(peek_event(RECORDED["presence"]), "presence.update")
+        self.assertIsNone(peek_event(b"not json"))
+
+
+@tagged("whatsapp_benchmark", "post_install", "-at_install", "-standard")
+class BenchmarkWebhookPrefilter(common.TransactionCase):
+    """Throughput of the prefilter against the full JSON parse, run with --test-tags whatsapp_benchmark."""
+
+    def _throughput(self, func, raw_body, rounds=200):
+        start = time.perf_counter()
+        for _i in range(rounds):
+            func(raw_body)
+        return rounds / (time.perf_counter() - start)
+
+    def test_benchmark_prefilter(self):
+        for name, raw_body in RECORDED.items():
+            parsed = self._throughput(_full_parse, raw_body)
+            filtered = self._throughput(prefilter, raw_body)
+            _logger.info(
+                "%-15s %9d bytes: full parse %10.0f/s, prefilter %10.0f/s (x%.1f)",
+                name, len(raw_body), parsed, filtered, filtered / parsed,
+            )